@@ -0,0 +1,38 @@
+from flask import Blueprint, abort, render_template
+
+from asyncdb import run, get_venue_details, get_artist_details
+from cache import page_cache
+
+aio = Blueprint('aio', __name__)
+
+
+@aio.route('/aio/venues/<int:venue_id>')
+async def show_venue(venue_id):
+    """
+    Async handler to show a specific Venue, its queries run concurrently
+    :param venue_id: Id of the Venue
+    :return: Rendered Show venue template
+    """
+    data = page_cache.get(('venue', venue_id))
+    if data is None:
+        data = await run(get_venue_details(venue_id))
+        if data is None:
+            abort(404)
+        page_cache.set(('venue', venue_id), data)
+    return render_template('pages/show_venue.html', venue=data)
+
+
+@aio.route('/aio/artists/<int:artist_id>')
+async def show_artist(artist_id):
+    """
+    Async handler to show a specific Artist, its queries run concurrently
+    :param artist_id: Id of the Artist
+    :return: Rendered Show artist template
+    """
+    data = page_cache.get(('artist', artist_id))
+    if data is None:
+        data = await run(get_artist_details(artist_id))
+        if data is None:
+            abort(404)
+        page_cache.set(('artist', artist_id), data)
+    return render_template('pages/show_artist.html', artist=data)
@@ -0,0 +1,93 @@
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, current_app, request, stream_with_context
+from sqlalchemy.orm import joinedload
+
+from helpers import json_default, get_shows_between
+from models import Venue, Artist, Show, Location
+
+api = Blueprint('api', __name__)
+
+
+def stream_json_array(query, serialize) -> Response:
+    """
+    Streams the rows of a query as a JSON array. Rows are read through a server side cursor in batches of
+    API_STREAM_BATCH_SIZE and each batch is sent as soon as it is serialized, so memory use doesn't depend on the number
+    of rows
+    :param query: Query to stream, ordered
+    :param serialize: Function serializing a row to a dict
+    :return: Streaming JSON response
+    """
+    batch_size = current_app.config['API_STREAM_BATCH_SIZE']
+
+    def generate():
+        separator = '['
+        chunk = []
+        for row in query.yield_per(batch_size):
+            chunk.append(separator)
+            chunk.append(json.dumps(serialize(row), default=json_default))
+            separator = ','
+            if len(chunk) >= 2 * batch_size:
+                yield ''.join(chunk)
+                chunk = []
+        chunk.append('[]' if separator == '[' else ']')
+        yield ''.join(chunk)
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+@api.route('/api/venues')
+def venues():
+    """
+    Handler to stream all venues as JSON
+    :return: JSON array of venues
+    """
+    return stream_json_array(Venue.query.order_by(Venue.id), lambda v: v.short_serialize)
+
+
+@api.route('/api/artists')
+def artists():
+    """
+    Handler to stream all artists as JSON
+    :return: JSON array of artists
+    """
+    return stream_json_array(Artist.query.order_by(Artist.id), lambda a: a.short_serialize)
+
+
+@api.route('/api/locations')
+def locations():
+    """
+    Handler to stream the locations with venues, with their venue and upcoming show counts, as JSON. Locations whose
+    last venue was moved or deleted are kept for venues listed there again, but not listed
+    :return: JSON array of locations
+    """
+    query = Location.query.filter(Location.venue_count > 0).order_by(Location.id)
+    return stream_json_array(query, lambda l: l.serialize)
+
+
+@api.route('/api/shows')
+def shows():
+    """
+    Handler to stream all shows as JSON
+    :return: JSON array of shows
+    """
+    query = Show.query.options(joinedload(Show.artist), joinedload(Show.venue)).order_by(Show.id)
+    return stream_json_array(query, lambda s: s.show_details)
+
+
+@api.route('/api/shows/between')
+def shows_between():
+    """
+    Handler to stream the shows starting in [start, end) as JSON, ordered by start time. start and end are ISO 8601
+    date times in the query string, location_id and venue_id optionally narrow the shows down
+    :return: JSON array of shows
+    """
+    try:
+        start = datetime.fromisoformat(request.args['start'])
+        end = datetime.fromisoformat(request.args['end'])
+    except (KeyError, ValueError):
+        abort(400)
+    query = get_shows_between(start, end, request.args.get('location_id', type=int),
+                              request.args.get('venue_id', type=int))
+    return stream_json_array(query, lambda s: s.show_details)
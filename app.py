@@ -3,48 +3,86 @@
 # ----------------------------------------------------------------------------#
 
 import logging
+import re
+from functools import lru_cache
 from logging import Formatter, FileHandler
 
 import babel
+import babel.dates
 import dateutil.parser
 from flask import render_template
-from sqlalchemy import desc
+from markupsafe import Markup, escape
 
+import commands  # noqa: F401 registers the flask CLI commands
+import instrumentation  # noqa: F401 registers the SQL instrumentation
+import metrics  # noqa: F401 registers the request and template metrics
+from aio.aio import aio
+from api.api import api
 from appconfig import app
 from artist.artist import artist
-from models import Artist, Venue
+from cache import FragmentCacheExtension
+from feed import recent_venues, recent_artists
+from routing import read_only
 from show.show import show
 from venues.venue import venue
+from internal.internal import internal
 
 APPLICATION_NAME = "app.py"
 
 app.register_blueprint(artist)
 app.register_blueprint(venue)
 app.register_blueprint(show)
+app.register_blueprint(internal)
+app.register_blueprint(api)
+app.register_blueprint(aio)
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=None)
+def compiled_datetime_format(format, locale):
+    # Parsing the babel pattern and the locale is the expensive part of formatting, do it once per format and locale
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+
+@lru_cache(maxsize=4096)
+def format_datetime(value, format='medium', locale='en'):
+    # Accepts datetime objects, strings are still parsed for callers serializing dates themselves. Results are memoized
+    # as the same show times are rendered over and over
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    pattern, locale = compiled_datetime_format(format, locale)
+    return pattern.apply(value, locale)
 
 
 app.jinja_env.filters['datetime'] = format_datetime
 
 
+def highlight(value, search_term):
+    # Wrap the case insensitive matches of the search term in <mark> tags, everything else is escaped
+    if not value or not search_term:
+        return value
+    parts = re.split(f'({re.escape(search_term)})', value, flags=re.IGNORECASE)
+    return Markup('').join(Markup('<mark>%s</mark>') % part if i % 2 else escape(part) for i, part in enumerate(parts))
+
+
+app.jinja_env.filters['highlight'] = highlight
+app.jinja_env.add_extension(FragmentCacheExtension)
+
+
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
 
 @app.route('/')
+@read_only
 def index():
     # Show the recently added top 10 Venue and Artists on the home page
-    venues = Venue.query.order_by(desc(Venue.created_date)).limit(10).all()
-    artists = Artist.query.order_by(desc(Artist.created_date)).limit(10).all()
-    return render_template('pages/home.html', venues=venues, artists=artists)
+    return render_template('pages/home.html', venues=recent_venues.items(), artists=recent_artists.items())
 
 
 @app.errorhandler(404)
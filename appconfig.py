@@ -5,14 +5,13 @@ from flask_migrate import Migrate
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 
-from config import SQLALCHEMY_DATABASE_URI
+from pool import TimedQueuePool
+from routing import RoutingSession
 
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-
-db = SQLAlchemy(app)
+# SQLALCHEMY_ENGINE_OPTIONS only applies to the primary, passed to the constructor the replica binds get them as well
+db = SQLAlchemy(app, engine_options={'poolclass': TimedQueuePool, **app.config['SQLALCHEMY_ENGINE_OPTIONS']},
+                session_options={'class_': RoutingSession})
 migrate = Migrate(app, db, compare_type=True)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -1,25 +1,32 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash
 
 from appconfig import db
+from cache import page_cache, invalidate_pages
+from feed import recent_artists
 from forms import ArtistForm
-from helpers import get_artist_by_id, search_artist
+from helpers import get_artist_by_id, get_artists_page, search_artist, get_venue_ids_with_shows_of_artist, \
+    refresh_show_counts
 from models import Artist
+from routing import read_only
+from search_index import artist_index
 
 artist = Blueprint('artist', __name__, template_folder='templates')
 
 
 @artist.route('/artists')
+@read_only
 def artists():
     """
-    Handler to show all artists
-    :return: Rendered artists page template displaying all artists
+    Handler to show all artists, a page at a time
+    :return: Rendered artists page template displaying a page of artists
     """
-    all_artists = Artist.query.all()
-    data = [a.short_serialize for a in all_artists]
-    return render_template('pages/artists.html', artists=data)
+    page = get_artists_page(request.args.get('cursor'), request.args.get('direction', 'next'))
+    data = [{**a.short_serialize, 'num_upcoming_shows': a.upcoming_shows_count} for a in page.items]
+    return render_template('pages/artists.html', artists=data, page=page)
 
 
 @artist.route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
     """
     Search Artist Post handler. Searches artist by partial text match on Artist name
@@ -36,13 +43,14 @@ def search_artists():
 
 
 @artist.route('/artists/<int:artist_id>')
+@read_only
 def show_artist(artist_id):
     """
     SHow artist page handler
     :param artist_id:  Id of the artist
     :return: Rendered show artist template
     """
-    data = get_artist_by_id(artist_id).artist_details
+    data = page_cache.get_or_set(('artist', artist_id), lambda: get_artist_by_id(artist_id).artist_details)
     return render_template('pages/show_artist.html', artist=data)
 
 
@@ -85,6 +93,10 @@ def edit_artist_submission(artist_id):
         artist_to_be_edited.seeking_description = form.seeking_description.data
 
         db.session.commit()
+        artist_index.add(artist_id, artist_name)
+        recent_artists.rename(artist_id, artist_name)
+        # venue pages show the names of their artists
+        invalidate_pages(get_venue_ids_with_shows_of_artist(artist_id), [artist_id])
         flash('Artist ' + artist_name + ' was successfully updated!', 'info')
     except Exception as ex:
         db.session.rollback()
@@ -131,6 +143,8 @@ def create_artist_submission():
             )
             db.session.add(new_artist)
             db.session.commit()
+            artist_index.add(new_artist.id, new_artist.name)
+            recent_artists.push(new_artist)
 
             flash('Artist ' + form.name.data + ' was successfully listed!', 'info')
     except Exception as ex:
@@ -152,9 +166,15 @@ def delete_artist(artist_id):
     try:
         artist_to_be_deleted = get_artist_by_id(artist_id)
         artist_name = artist_to_be_deleted.name
+        venue_ids = get_venue_ids_with_shows_of_artist(artist_id)
         # delete the artist
         db.session.delete(artist_to_be_deleted)
+        # the shows of the artist are deleted with it
+        refresh_show_counts(venue_ids=venue_ids)
         db.session.commit()
+        artist_index.remove(artist_id)
+        recent_artists.remove(artist_id)
+        invalidate_pages(venue_ids, [artist_id])
         flash('Artist ' + artist_name + ' was successfully deleted!', 'info')
     except Exception as ex:
         db.session.rollback()
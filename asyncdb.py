@@ -0,0 +1,95 @@
+# Async database access
+#
+# Used by the async read handlers (see aio/aio.py) to run the independent queries of a page concurrently. Flask runs
+# every async view in an event loop of its own, while connections can't move between event loops. So the queries run
+# on a single event loop in a background thread, where the engine can keep a pool of connections, and the views await
+# them from their own loop with run().
+
+import asyncio
+import datetime
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import joinedload
+
+from appconfig import app
+from models import Venue, Artist, Show
+
+engine = create_async_engine(
+    make_url(app.config['SQLALCHEMY_DATABASE_URI']).set(drivername='postgresql+asyncpg'),
+    pool_size=app.config['DB_POOL_SIZE'],
+    max_overflow=app.config['DB_MAX_OVERFLOW'],
+    pool_timeout=app.config['DB_POOL_TIMEOUT'],
+    pool_recycle=app.config['DB_POOL_RECYCLE'],
+    pool_pre_ping=app.config['DB_POOL_PRE_PING'],
+    connect_args={'server_settings': {'statement_timeout': str(app.config['DB_STATEMENT_TIMEOUT_MS'])}},
+)
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def run(coroutine):
+    """
+    Runs the coroutine on the database event loop, starting the loop on first use
+    :param coroutine: Coroutine using the engine
+    :return: Awaitable with the result of the coroutine, for the event loop of the caller
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='asyncdb', daemon=True).start()
+    return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, _loop))
+
+
+async def fetch_all(statement) -> list:
+    """
+    Runs the statement in a session of its own, so that it can run concurrently with other statements
+    :param statement: Select statement
+    :return: List of the selected objects
+    """
+    async with AsyncSession(engine) as session:
+        return (await session.execute(statement)).unique().scalars().all()
+
+
+async def fetch_first(statement):
+    """
+    Runs the statement in a session of its own and returns the first selected object, None if there is none
+    """
+    rows = await fetch_all(statement.limit(1))
+    return rows[0] if rows else None
+
+
+async def get_venue_details(venue_id):
+    """
+    Returns the Venue page data, loading the Venue, its past and its upcoming shows concurrently
+    :param venue_id: Venue id (pk)
+    :return: Venue page data, None if the Venue doesn't exist
+    """
+    now = datetime.datetime.now()
+    shows = select(Show).options(joinedload(Show.artist)).filter(Show.venue_id == venue_id).order_by(Show.start_time)
+    venue, past_shows, upcoming_shows = await asyncio.gather(
+        fetch_first(select(Venue).filter(Venue.id == venue_id)),
+        fetch_all(shows.filter(Show.start_time < now)),
+        fetch_all(shows.filter(Show.start_time >= now)),
+    )
+    return venue.venue_details_with_shows(past_shows, upcoming_shows) if venue else None
+
+
+async def get_artist_details(artist_id):
+    """
+    Returns the Artist page data, loading the Artist, its past and its upcoming shows concurrently
+    :param artist_id: Artist id (pk)
+    :return: Artist page data, None if the Artist doesn't exist
+    """
+    now = datetime.datetime.now()
+    shows = select(Show).options(joinedload(Show.venue)).filter(Show.artist_id == artist_id).order_by(Show.start_time)
+    artist, past_shows, upcoming_shows = await asyncio.gather(
+        fetch_first(select(Artist).filter(Artist.id == artist_id)),
+        fetch_all(shows.filter(Show.start_time < now)),
+        fetch_all(shows.filter(Show.start_time >= now)),
+    )
+    return artist.artist_details_with_shows(past_shows, upcoming_shows) if artist else None
@@ -0,0 +1,54 @@
+# Datetime filter benchmark
+#
+# Formats the start times of a page of shows with the previous filter, which parsed the str() of the start time and
+# formatted it with babel.dates.format_datetime, and with the current one.
+#
+#   python -m benchmarks.datetime_filter --shows 10000
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from app import format_datetime
+
+
+def previous_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def timed(func, values):
+    start = time.perf_counter()
+    for value in values:
+        func(value, 'full')
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the datetime template filter.')
+    parser.add_argument('--shows', type=int, default=10000, help='number of shows on the page')
+    args = parser.parse_args()
+
+    # shows start on the hour, so like on a real page many of them share a start time
+    start_times = [datetime(2021, 1, 1, 20) + timedelta(hours=i % 2000) for i in range(args.shows)]
+    assert all(previous_format_datetime(str(t), 'full') == format_datetime(t, 'full') for t in start_times[:100])
+
+    format_datetime.cache_clear()
+    previous = timed(previous_format_datetime, [str(t) for t in start_times])
+    cold = timed(format_datetime, start_times)
+    warm = timed(format_datetime, start_times)
+    print(f'{args.shows} shows')
+    print(f'previous filter         {previous:10.1f} ms')
+    print(f'current filter (cold)   {cold:10.1f} ms')
+    print(f'current filter (warm)   {warm:10.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# Detail page benchmark
+#
+# Requests the venue and artist pages with the most shows from many threads at once, through the sync handlers and
+# through the async ones (see aio/aio.py), and compares throughput and latency. The page cache is disabled so every
+# request goes to the database.
+#
+#   python -m benchmarks.detail_pages --concurrency 64 --requests 2000
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func
+
+from app import app
+from appconfig import db
+from cache import page_cache
+from models import Show
+
+
+def busiest(column):
+    return db.session.query(column).group_by(column).order_by(func.count().desc()).limit(1).scalar()
+
+
+def run(urls, concurrency, requests):
+    client = app.test_client()
+
+    def get(i):
+        start = time.perf_counter()
+        response = client.get(urls[i % len(urls)])
+        assert response.status_code == 200, response.status_code
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        timings = sorted(executor.map(get, range(requests)))
+    elapsed = time.perf_counter() - start
+    return requests / elapsed, statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the sync and async detail page handlers.')
+    parser.add_argument('--concurrency', type=int, default=64, help='number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=2000, help='number of requests per handler')
+    args = parser.parse_args()
+
+    page_cache.max_entries = 0
+    with app.app_context():
+        venue_id, artist_id = busiest(Show.venue_id), busiest(Show.artist_id)
+        db.session.close()
+    if venue_id is None:
+        parser.error('the database has no shows')
+
+    print(f'{args.concurrency} clients, {args.requests} requests per handler')
+    print(f"{'handler':<12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, urls in [('sync', [f'/venues/{venue_id}', f'/artists/{artist_id}']),
+                       ('async', [f'/aio/venues/{venue_id}', f'/aio/artists/{artist_id}'])]:
+        throughput, p50, p95 = run(urls, args.concurrency, args.requests)
+        print(f'{name:<12}{throughput:>10.1f}{p50:>10.1f}{p95:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+# Route benchmark
+#
+# Requests every route of the artist, venue and show blueprints against a catalog loaded with benchmarks.seed and
+# reports the p50, p95 and p99 latency and the SQL statements per request. The page and fragment caches are disabled
+# unless --cache is given, so the numbers show the work done per request. The write routes create their own venues,
+# artists and shows, and the delete routes remove them again.
+#
+# Baselines are stored in benchmarks/baselines. A route regresses when its p95 latency exceeds the baseline by more
+# than --tolerance and by more than --min-delta-ms, when it runs more SQL statements than in the baseline, or when any
+# of its requests fails. Any regression makes the exit status 1.
+#
+#   DATABASE_URL=postgresql://postgres@localhost:5432/fyyur_bench python -m benchmarks.routes --save-baseline shows-1k
+#   DATABASE_URL=postgresql://postgres@localhost:5432/fyyur_bench python -m benchmarks.routes --baseline shows-1k
+
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+from flask import message_flashed
+from sqlalchemy import func
+
+import instrumentation
+from app import app
+from appconfig import db
+from cache import page_cache, fragment_cache
+from models import Venue, Artist, Show
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+BLUEPRINTS = ('artist', 'venue', 'show')
+START_TIME = '2030-01-01 20:00:00'
+
+
+def _venue_form(i):
+    return {'name': f'Benchmark Venue {i}', 'city': 'San Francisco', 'state': 'CA', 'address': f'{i} Bench Street',
+            'phone': '555-0100', 'genres': ['Jazz', 'Blues'], 'facebook_link': 'https://facebook.com/bench',
+            'image_link': 'https://example.com/bench.jpg', 'website': 'https://example.com',
+            'seeking_talent': 'y', 'seeking_description': 'Benchmark'}
+
+
+def _artist_form(i):
+    return {'name': f'Benchmark Artist {i}', 'city': 'San Francisco', 'state': 'CA', 'phone': '555-0100',
+            'genres': ['Jazz'], 'facebook_link': 'https://facebook.com/bench',
+            'image_link': 'https://example.com/bench.jpg', 'website': 'https://example.com',
+            'seeking_venue': 'y', 'seeking_description': 'Benchmark'}
+
+
+def _batch_form(i, ctx):
+    artist_id, venue_id = ctx['new_artist_ids'][i], ctx['new_venue_ids'][i]
+    return {'shows': '\n'.join(f'{artist_id}, {venue_id}, 2030-02-{day:02d} 20:00' for day in range(1, 11))}
+
+
+# (endpoint, method, function of the request number and context returning the url and form data), in the order they
+# run: reads, then creates, then writes using the created venues and artists, then the deletes removing them
+ROUTES = [
+    ('venue.venues', 'GET', lambda i, ctx: ('/venues', None)),
+    ('venue.show_venue', 'GET', lambda i, ctx: (f"/venues/{ctx['venue_id']}", None)),
+    ('venue.show_area', 'GET', lambda i, ctx: (f"/venues/areas/{ctx['location_id']}", None)),
+    ('venue.create_venue_form', 'GET', lambda i, ctx: ('/venues/create', None)),
+    ('venue.edit_venue', 'GET', lambda i, ctx: (f"/venues/{ctx['venue_id']}/edit", None)),
+    ('venue.search_venues', 'POST', lambda i, ctx: ('/venues/search', {'search_term': 'jazz'})),
+    ('artist.artists', 'GET', lambda i, ctx: ('/artists', None)),
+    ('artist.show_artist', 'GET', lambda i, ctx: (f"/artists/{ctx['artist_id']}", None)),
+    ('artist.create_artist_form', 'GET', lambda i, ctx: ('/artists/create', None)),
+    ('artist.edit_artist', 'GET', lambda i, ctx: (f"/artists/{ctx['artist_id']}/edit", None)),
+    ('artist.search_artists', 'POST', lambda i, ctx: ('/artists/search', {'search_term': 'jazz'})),
+    ('show.shows', 'GET', lambda i, ctx: ('/shows', None)),
+    ('show.shows_calendar', 'GET', lambda i, ctx: ('/shows/calendar', None)),
+    ('show.create_shows', 'GET', lambda i, ctx: ('/show/create', None)),
+    ('show.create_shows_batch', 'GET', lambda i, ctx: ('/show/create/batch', None)),
+    ('show.search_shows', 'POST', lambda i, ctx: ('/shows/search', {'search_term': 'jazz'})),
+    ('venue.create_venue_submission', 'POST', lambda i, ctx: ('/venues/create', _venue_form(i))),
+    ('artist.create_artist_submission', 'POST', lambda i, ctx: ('/artists/create', _artist_form(i))),
+    ('venue.edit_venue_submission', 'POST',
+     lambda i, ctx: (f"/venues/{ctx['new_venue_ids'][i]}/edit", _venue_form(i))),
+    ('artist.edit_artist_submission', 'POST',
+     lambda i, ctx: (f"/artists/{ctx['new_artist_ids'][i]}/edit", _artist_form(i))),
+    ('show.create_show_submission', 'POST',
+     lambda i, ctx: ('/show/create', {'artist_id': ctx['new_artist_ids'][i], 'venue_id': ctx['new_venue_ids'][i],
+                                      'start_time': START_TIME})),
+    ('show.create_shows_batch_submission', 'POST', lambda i, ctx: ('/show/create/batch', _batch_form(i, ctx))),
+    ('venue.delete_venue', 'DELETE', lambda i, ctx: (f"/venues/{ctx['new_venue_ids'][i]}", None)),
+    ('artist.delete_artist', 'DELETE', lambda i, ctx: (f"/artists/{ctx['new_artist_ids'][i]}", None)),
+]
+
+
+def percentile(values, p):
+    """
+    Returns the p-th percentile of the sorted values, nearest rank method
+    """
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def catalog_size() -> dict:
+    return {'venues': Venue.query.count(), 'artists': Artist.query.count(), 'shows': Show.query.count()}
+
+
+def busiest(column):
+    return db.session.query(column).group_by(column).order_by(func.count().desc()).limit(1).scalar()
+
+
+def created_ids(model, prefix) -> list:
+    return [row.id for row in db.session.query(model.id).filter(model.name.like(prefix + ' %')).order_by(model.id)]
+
+
+def run_route(client, method, request_for, requests, warmup, ctx) -> dict:
+    """
+    Requests a route and measures it. A request fails with an error status or when it flashes a 'danger' message, as
+    the write handlers catch their errors and report them that way, redirecting with a 302
+    :return: Dict with the p50, p95 and p99 latency in ms, the most SQL statements of a request and the error count
+    """
+    timings, statements, errors = [], 0, 0
+    failures = []
+
+    def flashed(sender, message, category, **extra):
+        if category == 'danger':
+            failures.append(message)
+
+    with message_flashed.connected_to(flashed, app):
+        for i in range(-warmup, requests):
+            url, data = request_for(max(i, 0), ctx)
+            failures.clear()
+            start = time.perf_counter()
+            response = client.open(url, method=method, data=data)
+            elapsed = (time.perf_counter() - start) * 1000
+            # flashed messages left for the page redirected to would pile up in the session cookie
+            with client.session_transaction() as session:
+                session.pop('_flashes', None)
+            if i < 0:
+                continue
+            timings.append(elapsed)
+            statements = max(statements, int(response.headers.get('X-SQL-Count', 0)))
+            errors += response.status_code >= 400 or bool(failures)
+    timings.sort()
+    return {'p50': round(percentile(timings, 50), 2), 'p95': round(percentile(timings, 95), 2),
+            'p99': round(percentile(timings, 99), 2), 'queries': statements, 'errors': errors}
+
+
+def compare(results, baseline, tolerance, min_delta) -> list:
+    """
+    Returns the regressions of the results against the baseline
+    :return: List of (endpoint, description)
+    """
+    regressions = []
+    for endpoint, result in results.items():
+        if result['errors']:
+            regressions.append((endpoint, f"{result['errors']} failed requests"))
+        base = baseline['routes'].get(endpoint)
+        if base is None:
+            continue
+        if result['p95'] > base['p95'] * (1 + tolerance) and result['p95'] - base['p95'] > min_delta:
+            regressions.append((endpoint, f"p95 {result['p95']:.1f} ms, baseline {base['p95']:.1f} ms"))
+        if result['queries'] > base['queries']:
+            regressions.append((endpoint, f"{result['queries']} queries, baseline {base['queries']}"))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every artist, venue and show route.')
+    parser.add_argument('--requests', type=int, default=50, help='number of measured requests per route')
+    parser.add_argument('--warmup', type=int, default=5, help='number of unmeasured requests per read route')
+    parser.add_argument('--cache', action='store_true', help='keep the page and fragment caches enabled')
+    parser.add_argument('--baseline', help='name of the baseline to compare with')
+    parser.add_argument('--save-baseline', help='name under which to store the results as baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative p95 increase')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                        help='p95 increases up to this many ms are never regressions, fast routes are noisy')
+    args = parser.parse_args()
+
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint.split('.')[0] in BLUEPRINTS}
+    missing = endpoints - {endpoint for endpoint, _, _ in ROUTES}
+    if missing:
+        parser.error('no benchmark request for ' + ', '.join(sorted(missing)))
+
+    app.config['SQL_STATS_HEADERS'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    # the per request SQL summaries would flood the log
+    instrumentation.logger.setLevel(logging.WARNING)
+    if not args.cache:
+        page_cache.max_entries = fragment_cache.max_entries = 0
+
+    with app.app_context():
+        catalog = catalog_size()
+        ctx = {'venue_id': busiest(Show.venue_id), 'artist_id': busiest(Show.artist_id),
+               'location_id': busiest(Venue.location_id)}
+        db.session.close()
+    if ctx['venue_id'] is None:
+        parser.error('the catalog has no shows, load one with benchmarks.seed')
+
+    client = app.test_client()
+    results = {}
+    print(f"{catalog['venues']} venues, {catalog['artists']} artists, {catalog['shows']} shows, "
+          f'{args.requests} requests per route')
+    print(f"{'route':<38}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'errors':>8}")
+    for endpoint, method, request_for in ROUTES:
+        if endpoint == 'venue.edit_venue_submission':
+            # the routes from here on use the venues and artists created by the routes before
+            with app.app_context():
+                ctx['new_venue_ids'] = created_ids(Venue, 'Benchmark Venue')
+                ctx['new_artist_ids'] = created_ids(Artist, 'Benchmark Artist')
+                db.session.close()
+        # only read routes are warmed up, extra writes would leave rows behind
+        warmup = args.warmup if method == 'GET' or '.search' in endpoint else 0
+        result = results[endpoint] = run_route(client, method, request_for, args.requests, warmup, ctx)
+        print(f"{endpoint:<38}{result['p50']:>9.1f}{result['p95']:>9.1f}{result['p99']:>9.1f}"
+              f"{result['queries']:>9}{result['errors']:>8}")
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, args.save_baseline + '.json')
+        with open(path, 'w') as f:
+            json.dump({'catalog': catalog, 'requests': args.requests, 'routes': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'saved baseline {path}')
+
+    if args.baseline:
+        with open(os.path.join(BASELINE_DIR, args.baseline + '.json')) as f:
+            baseline = json.load(f)
+        if baseline['catalog'] != catalog:
+            print(f"warning: baseline was measured on {baseline['catalog']}")
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        for endpoint, description in regressions:
+            print(f'REGRESSION {endpoint}: {description}')
+        if regressions:
+            sys.exit(1)
+        print(f'no regressions against baseline {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
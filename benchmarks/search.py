@@ -0,0 +1,69 @@
+# Search benchmark
+#
+# Loads synthetic venues, artists and shows inside a transaction, times the search helpers against them and rolls the
+# transaction back, so the database is left untouched.
+#
+#   python -m benchmarks.search --rows 1000000
+
+import argparse
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app import app
+from appconfig import db
+from helpers import search_venue, search_artist, search_show
+
+WORDS = ['Blue', 'Red', 'Velvet', 'Jazz', 'Cellar', 'Hall', 'Lounge', 'Garden', 'Tavern', 'Club', 'Park', 'Room']
+TERMS = ['jazz', 'velvet lounge', 'cellar 42', 'xyz']
+
+
+def load(rows):
+    words = "(ARRAY[" + ', '.join(f"'{w}'" for w in WORDS) + "])"
+    name = f"{words}[1 + i % 12] || ' ' || {words}[1 + (i / 12) % 12] || ' ' || i"
+    for table in ['Venue', 'Artist']:
+        db.session.execute(text(f'INSERT INTO "{table}" (name, city, state, created_date, updated_date) '
+                                f"SELECT {name}, 'San Francisco', 'CA', now(), now() "
+                                'FROM generate_series(1, :rows) AS i'),
+                           {'rows': rows})
+    db.session.execute(text('INSERT INTO "Show" (artist_id, venue_id, start_time, created_date) '
+                            'SELECT a.id, v.id, now(), now() FROM '
+                            '(SELECT id, row_number() OVER () AS n FROM "Artist") a JOIN '
+                            '(SELECT id, row_number() OVER () AS n FROM "Venue") v ON a.n = v.n'))
+    for table in ['Venue', 'Artist', 'Show']:
+        db.session.execute(text(f'ANALYZE "{table}"'))
+
+
+def timed(func, term, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = func(term)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return len(results), statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the search helpers.')
+    parser.add_argument('--rows', type=int, default=1000000, help='number of venues and artists to load')
+    parser.add_argument('--repeat', type=int, default=20, help='number of runs per search term')
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            start = time.perf_counter()
+            load(args.rows)
+            print(f'loaded {args.rows} venues, artists and shows in {time.perf_counter() - start:.1f}s')
+            print(f"{'helper':<15}{'term':<16}{'results':>8}{'p50 ms':>10}{'p95 ms':>10}")
+            for func in [search_venue, search_artist, search_show]:
+                for term in TERMS:
+                    count, p50, p95 = timed(func, term, args.repeat)
+                    print(f'{func.__name__:<15}{term:<16}{count:>8}{p50:>10.2f}{p95:>10.2f}')
+        finally:
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
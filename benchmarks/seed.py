@@ -0,0 +1,103 @@
+# Benchmark data generator
+#
+# Loads a deterministic catalog into the database configured by DATABASE_URL: the given number of shows, a venue per
+# 20 shows and an artist per 10 shows. Names, places, genres and the pairing of shows with venues and artists only
+# depend on the row number, start times are spread over a year before and a year after the day of the load. Point
+# DATABASE_URL at a database of its own, --reset empties the catalog tables first.
+#
+#   DATABASE_URL=postgresql://postgres@localhost:5432/fyyur_bench python -m benchmarks.seed --shows 100000 --reset
+
+import argparse
+import time
+from datetime import datetime
+
+from sqlalchemy import text, true
+
+from app import app
+from appconfig import db
+from helpers import assign_locations_statements, sweep_show_counts
+from models import Venue, Artist, Show, Location
+
+WORDS = ['Blue', 'Red', 'Velvet', 'Jazz', 'Cellar', 'Hall', 'Lounge', 'Garden', 'Tavern', 'Club', 'Park', 'Room']
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'), ('Seattle', 'WA'), ('Chicago', 'IL'),
+          ('Nashville', 'TN'), ('Denver', 'CO'), ('Portland', 'OR'), ('Boston', 'MA'), ('Atlanta', 'GA')]
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop', 'Jazz', 'Pop',
+          'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul']
+
+
+def _array(values) -> str:
+    return '(ARRAY[' + ', '.join("'" + v.replace("'", "''") + "'" for v in values) + '])'
+
+
+def scale(shows) -> dict:
+    """
+    Returns the number of rows per table for a number of shows
+    """
+    return {'shows': shows, 'venues': max(1, shows // 20), 'artists': max(1, shows // 10)}
+
+
+def load(shows):
+    """
+    Loads the catalog into the empty Location, Venue, Artist and Show tables
+    :param shows: Number of shows
+    :return: Number of rows per table
+    """
+    rows = scale(shows)
+    words, genres = _array(WORDS), _array(GENRES)
+    cities, states = _array([c for c, _ in CITIES]), _array([s for _, s in CITIES])
+    name = f"{words}[1 + i % 12] || ' ' || {words}[1 + (i / 12) % 12] || ' ' || i"
+    place = f'{cities}[1 + i % {len(CITIES)}], {states}[1 + i % {len(CITIES)}]'
+    genre_list = f'ARRAY[{genres}[1 + i % 15], {genres}[1 + (i / 15) % 15]]'
+    # created a minute apart from the start of 2024, so the recently listed order is fixed too
+    created = "TIMESTAMP '2024-01-01' + i * INTERVAL '1 minute'"
+    db.session.execute(text(
+        'INSERT INTO "Venue" (name, city, state, address, phone, genres, image_link, facebook_link, website, '
+        'seeking_talent, seeking_description, created_date, updated_date) '
+        f"SELECT {name}, {place}, i || ' Main Street', '555-' || lpad((i % 10000)::text, 4, '0'), {genre_list}, "
+        "'https://example.com/venues/' || i || '.jpg', 'https://facebook.com/venue' || i, "
+        "'https://example.com/venues/' || i, i % 3 = 0, 'Looking for bands', "
+        f'{created}, {created} FROM generate_series(1, :rows) AS i'), {'rows': rows['venues']})
+    db.session.execute(text(
+        'INSERT INTO "Artist" (name, city, state, phone, genres, image_link, facebook_link, website, '
+        'seeking_venue, seeking_description, created_date, updated_date) '
+        f"SELECT {name}, {place}, '555-' || lpad((i % 10000)::text, 4, '0'), {genre_list}, "
+        "'https://example.com/artists/' || i || '.jpg', 'https://facebook.com/artist' || i, "
+        "'https://example.com/artists/' || i, i % 2 = 0, 'Looking for venues', "
+        f'{created}, {created} FROM generate_series(1, :rows) AS i'), {'rows': rows['artists']})
+    # multiplying by primes spreads the shows of a venue or artist over the whole year. Up to a few million shows no
+    # venue or artist gets two shows on one day, so they never overlap, which the exclusion constraints on Show require
+    db.session.execute(text(
+        'INSERT INTO "Show" (venue_id, artist_id, start_time, created_date) '
+        'SELECT v.first + (i * 7919) % :venues, a.first + (i * 104729) % :artists, '
+        "date_trunc('day', now()) + ((i * 37) % 730 - 365) * INTERVAL '1 day' + (18 + i % 5) * INTERVAL '1 hour', "
+        f'{created} FROM generate_series(1, CAST(:shows AS bigint)) AS i, '
+        '(SELECT min(id) AS first FROM "Venue") v, (SELECT min(id) AS first FROM "Artist") a'), rows)
+    for statement in assign_locations_statements(true()):
+        db.session.execute(statement)
+    # also computes the upcoming show counts of the locations
+    sweep_show_counts(datetime.now(), full=True)
+    for table in ['Location', 'Venue', 'Artist', 'Show']:
+        db.session.execute(text(f'ANALYZE "{table}"'))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load a deterministic benchmark catalog.')
+    parser.add_argument('--shows', type=int, default=1000, help='number of shows, e.g. 1000, 100000 or 1000000')
+    parser.add_argument('--reset', action='store_true', help='delete all venues, artists and shows first')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.reset:
+            db.session.execute(text('TRUNCATE "Show", "Venue", "Artist", "Location" RESTART IDENTITY'))
+        elif any(db.session.query(model.id).limit(1).first() for model in [Location, Venue, Artist, Show]):
+            parser.error('the catalog tables are not empty, use --reset to empty them')
+        start = time.perf_counter()
+        rows = load(args.shows)
+        db.session.commit()
+        print(f"loaded {rows['venues']} venues, {rows['artists']} artists and {rows['shows']} shows "
+              f'in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# Caches
+#
+# Caches are per process. Handlers invalidate the entries affected by their writes in their own process, entries in
+# other processes expire after their TTL.
+
+import threading
+import time
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from appconfig import app
+
+
+class LRUCache:
+    """
+    Thread safe least recently used cache whose entries expire after a TTL. Counts hits and misses
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value of the key, default if it isn't cached or has expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """
+        Caches the value of the key, evicting the least recently used entry if the cache is full
+        """
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key, compute, ttl=None):
+        """
+        Returns the cached value of the key, computing and caching it on a miss
+        :param key: Cache key
+        :param compute: Function returning the value
+        :param ttl: Seconds the value is cached for, defaults to the cache TTL
+        :return: Value
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, *keys):
+        """
+        Removes the keys from the cache
+        """
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None,
+            }
+
+
+_MISSING = object()
+
+# Data of the venue and artist detail pages, keyed by ('venue', id) and ('artist', id)
+page_cache = LRUCache(app.config['PAGE_CACHE_MAX_ENTRIES'], app.config['PAGE_CACHE_TTL'])
+
+
+def invalidate_pages(venue_ids=(), artist_ids=()):
+    """
+    Invalidates the cached pages of the venues and artists
+    """
+    page_cache.invalidate(*[('venue', int(i)) for i in venue_ids], *[('artist', int(i)) for i in artist_ids])
+
+
+# Rendered template fragments, keyed by the key given to the {% cache %} tag
+fragment_cache = LRUCache(app.config['FRAGMENT_CACHE_MAX_ENTRIES'], app.config['FRAGMENT_CACHE_TTL'])
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Adds a {% cache key, ttl %}...{% endcache %} tag which caches the rendered block in fragment_cache. The key has to
+    identify everything the block shows, e.g. the entity ids with their last modified time, so that a changed entity
+    gets a new key instead of an invalidation. The ttl is optional and defaults to FRAGMENT_CACHE_TTL
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, ttl, caller):
+        return fragment_cache.get_or_set(key, caller, ttl)
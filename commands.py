@@ -0,0 +1,534 @@
+# Flask CLI commands
+
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import event, select, text, ARRAY, Boolean, DateTime, Integer
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Query
+from werkzeug.exceptions import HTTPException
+
+import helpers
+from appconfig import app, db
+from models import Venue, Artist, Show, Location, DEFAULT_SHOW_DURATION_MINUTES
+from search_index import venue_index, artist_index
+
+
+def _capture_statements(func, *args) -> list:
+    """
+    Runs func and captures the SQL statements (with their parameters) it sends to the database. When func returns a
+    query instead of its rows, the query is run
+    :param func: Function to run
+    :param args: Arguments passed to the function
+    :return: List of (statement, parameters) tuples
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        result = func(*args)
+        if isinstance(result, Query):
+            result.all()
+    except HTTPException:
+        # first_or_404 helpers abort when the sample id doesn't exist, the statement is still captured
+        pass
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+
+def _explain(statement, parameters, enable_sort=True) -> str:
+    """
+    Returns the query plan of a statement. Sequential scans are disabled while planning, as on small tables the planner
+    would prefer them even where an index can serve the statement
+    :param statement: SQL statement
+    :param parameters: Statement parameters
+    :param enable_sort: False to disable sorts as well
+    :return: Query plan as text
+    """
+    with db.engine.connect() as conn:
+        with conn.begin():
+            conn.exec_driver_sql('SET LOCAL enable_seqscan = off')
+            if not enable_sort:
+                conn.exec_driver_sql('SET LOCAL enable_sort = off')
+            rows = conn.exec_driver_sql('EXPLAIN ' + statement, parameters).all()
+    return '\n'.join(row[0] for row in rows)
+
+
+def _index_serves(plan, index) -> bool:
+    """
+    Tells whether an index serves a query plan: it is searched with an Index Cond, read by an index only scan, or read
+    in order without a filter in place of a sort. With sequential scans disabled the planner falls back to reading a
+    whole index, usually the primary key, and filtering its rows, which doesn't count
+    :param plan: Query plan as text
+    :param index: Index name
+    :return: True if the index serves the plan
+    """
+    lines = plan.splitlines()
+    for i, line in enumerate(lines):
+        if f' "{index}" ' not in line + ' ':
+            continue
+        indent = len(line) - len(line.lstrip(' -> '))
+        details = []
+        for detail in lines[i + 1:]:
+            if len(detail) - len(detail.lstrip()) <= indent or detail.lstrip().startswith('->'):
+                break
+            details.append(detail.strip())
+        if any(d.startswith('Index Cond:') for d in details) or 'Index Only Scan' in line:
+            return True
+        if 'Bitmap' not in line and not any(d.startswith('Filter:') for d in details) and 'Sort' not in plan:
+            return True
+    return False
+
+
+@app.cli.command('check-indexes')
+@click.option('--verbose', is_flag=True, help='Print the query plan of every statement.')
+def check_indexes(verbose):
+    """Checks with EXPLAIN that the lookup helpers are served by their indexes."""
+    venue_id = db.session.query(db.func.min(Venue.id)).scalar() or 1
+    artist_id = db.session.query(db.func.min(Artist.id)).scalar() or 1
+    show_id = db.session.query(db.func.min(Show.id)).scalar() or 1
+    location_id = db.session.query(db.func.min(Location.id)).scalar() or 1
+    # cursors of the first rows, so that the keyset conditions of the following pages are checked too
+    venue_key = [db.func.coalesce(Venue.location_id, 0), Venue.id]
+    venue_cursor = helpers.encode_cursor(db.session.query(*venue_key).order_by(*venue_key).first() or (0, 0))
+    show_cursor = helpers.encode_cursor(db.session.query(Show.start_time, Show.id)
+                                        .order_by(Show.start_time, Show.id).first() or (datetime.min, 0))
+    artist_cursor = helpers.encode_cursor(db.session.query(Artist.created_date, Artist.id)
+                                          .order_by(Artist.created_date, Artist.id).first() or (datetime.min, 0))
+    # a year of shows from the first one, so that the window isn't empty
+    first_show = db.session.query(db.func.min(Show.start_time)).scalar() or datetime.now()
+    window = (first_show, first_show + timedelta(days=365))
+    new_shows = [{'venue_id': venue_id, 'artist_id': artist_id, 'start_time': first_show,
+                  'duration_minutes': DEFAULT_SHOW_DURATION_MINUTES}]
+    db.session.close()
+
+    # helper, its arguments and the index which has to serve it
+    checks = [
+        (helpers.get_venues_grouped_by_location, (), 'ix_Venue_location_key_id'),
+        (helpers.get_venues_grouped_by_location, (venue_cursor,), 'ix_Venue_location_key_id'),
+        (helpers.get_shows_at_venue, (venue_id,), 'ix_Show_venue_id_start_time'),
+        (helpers.get_shows_of_artist, (artist_id,), 'ix_Show_artist_id_start_time'),
+        (helpers.get_recently_listed_venues, (), 'ix_Venue_created_date_id'),
+        (helpers.get_recently_listed_artists, (), 'ix_Artist_created_date_id'),
+        (helpers.get_venue_by_id, (venue_id,), 'Venue_pkey'),
+        (helpers.get_artist_by_id, (artist_id,), 'Artist_pkey'),
+        (helpers.get_show_by_id, (show_id,), 'Show_pkey'),
+        (helpers.get_shows_page, (), 'ix_Show_start_time_id'),
+        (helpers.get_shows_page, (show_cursor,), 'ix_Show_start_time_id'),
+        (helpers.get_shows_between, window, 'ix_Show_start_time_id'),
+        (helpers.get_shows_between, (*window, None, venue_id), 'ix_Show_venue_id_start_time'),
+        (helpers.get_overlapping_shows, (new_shows,), 'ex_Show_venue_id_period'),
+        (helpers.get_overlapping_shows, (new_shows,), 'ex_Show_artist_id_period'),
+        (helpers.get_artists_page, (), 'ix_Artist_created_date_id'),
+        (helpers.get_artists_page, (artist_cursor,), 'ix_Artist_created_date_id'),
+        (helpers.get_location_by_id, (location_id,), 'Location_pkey'),
+        (helpers.get_venues_page_at_location, (location_id,), 'ix_Venue_location_id_id'),
+    ]
+
+    failed = False
+    for func, args, index in checks:
+        plans = []
+        for statement, parameters in _capture_statements(func, *args):
+            plan = _explain(statement, parameters)
+            if not _index_serves(plan, index):
+                # on small tables the planner may sort the rows rather than read them in the order of the index
+                plan = _explain(statement, parameters, enable_sort=False)
+            plans.append(plan)
+        served = any(_index_serves(plan, index) for plan in plans) and not any('Seq Scan' in plan for plan in plans)
+        failed = failed or not served
+        name = f"{func.__name__}{' (cursor)' if args and isinstance(args[0], str) else ''}"
+        click.echo(f"{'OK  ' if served else 'FAIL'} {name}: {index}")
+        if verbose or not served:
+            click.echo('\n'.join(plans))
+    if failed:
+        sys.exit(1)
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """Rebuilds the in-process n-gram search index and prints its size."""
+    for index in [venue_index, artist_index]:
+        index.rebuild()
+        stats = index.stats
+        click.echo(f"{index.model.__tablename__}: {stats['entities']} names, {stats['ngrams']} n-grams, "
+                   f"{stats['postings']} postings ({stats['posting_bytes'] / 1024:.0f} KiB)")
+
+
+# Tables exported and imported by the catalog commands, in foreign key order
+CATALOG_TABLES = {
+    'venues': Venue.__table__,
+    'artists': Artist.__table__,
+    'shows': Show.__table__,
+}
+
+
+def _catalog_path(directory, table_name, file_format, compress) -> str:
+    return os.path.join(directory, f"{table_name}.{file_format}{'.gz' if compress else ''}")
+
+
+def _open_catalog_file(path, mode):
+    return gzip.open(path, mode + 't', newline='') if path.endswith('.gz') else open(path, mode, newline='')
+
+
+def _to_csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return json.dumps(value)
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _checkpoint_path(path) -> str:
+    return path + '.checkpoint'
+
+
+def _read_checkpoint(path):
+    """
+    Returns the checkpoint of an export file, a dict with the last id written and the file size after it, or None if
+    the file has no checkpoint
+    """
+    try:
+        with open(_checkpoint_path(path)) as checkpoint:
+            return json.load(checkpoint)
+    except FileNotFoundError:
+        return None
+
+
+def _write_checkpoint(path, last_id, offset):
+    """
+    Replaces the checkpoint of an export file atomically, so an interruption leaves the previous or the new one
+    """
+    temporary = _checkpoint_path(path) + '.tmp'
+    with open(temporary, 'w') as checkpoint:
+        json.dump({'last_id': last_id, 'offset': offset}, checkpoint)
+    os.replace(temporary, _checkpoint_path(path))
+
+
+def _export_table(table_name, path, file_format, resume, end_id, batch_size) -> tuple:
+    """
+    Streams the rows of a table ordered by id into a NDJSON or CSV file. Rows are read with Core through a server
+    side cursor, so they never enter the ORM identity map. Every batch is written (as its own gzip member when
+    compressed) and synced before the checkpoint of the file records its last id and the file size. Resuming truncates
+    the file to the checkpoint and continues after its last id. Runs in its own thread, with its own app context and
+    connection
+    :return: Tuple of (number of rows exported, last id exported)
+    """
+    table = CATALOG_TABLES[table_name]
+    checkpoint = _read_checkpoint(path) if resume else None
+    start_id = checkpoint['last_id'] if checkpoint else None
+    query = select(table).order_by(table.c.id)
+    if start_id is not None:
+        query = query.where(table.c.id > start_id)
+    if end_id is not None:
+        query = query.where(table.c.id <= end_id)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if file_format == 'csv' else None
+    if writer and checkpoint is None:
+        writer.writerow(table.c.keys())
+
+    def flush(output, last_id):
+        data = buffer.getvalue().encode('utf-8')
+        if data:
+            output.write(gzip.compress(data) if path.endswith('.gz') else data)
+            output.flush()
+            os.fsync(output.fileno())
+        _write_checkpoint(path, last_id, output.tell())
+        buffer.seek(0)
+        buffer.truncate()
+
+    count, last_id = 0, start_id
+    with app.app_context(), db.engine.connect() as conn, open(path, 'r+b' if checkpoint else 'wb') as output:
+        if checkpoint:
+            # drops what the interrupted run wrote after its last checkpoint, like a partial line or gzip member
+            output.truncate(checkpoint['offset'])
+            output.seek(checkpoint['offset'])
+        rows = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query).mappings()
+        for row in rows:
+            if writer:
+                writer.writerow([_to_csv_value(v) for v in row.values()])
+            else:
+                buffer.write(json.dumps(dict(row), default=helpers.json_default) + '\n')
+            count, last_id = count + 1, row['id']
+            if count % batch_size == 0:
+                flush(output, last_id)
+                click.echo(f'{table_name}: {count} rows, last id {last_id}', err=True)
+        flush(output, last_id)
+    return count, last_id
+
+
+@app.cli.command('export')
+@click.option('--output-dir', default='export', type=click.Path(file_okay=False), show_default=True,
+              help='Directory the files are written to.')
+@click.option('--format', 'file_format', default='ndjson', type=click.Choice(['ndjson', 'csv']), show_default=True)
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the files with gzip.')
+@click.option('--table', 'tables', multiple=True, type=click.Choice(list(CATALOG_TABLES)),
+              help='Table to export, can be repeated. Defaults to every table.')
+@click.option('--resume', is_flag=True, help='Continue every file after the last id of its checkpoint.')
+@click.option('--end-id', type=int, help='Only export rows up to this id.')
+@click.option('--batch-size', default=10000, show_default=True, help='Rows fetched and written at once.')
+@click.option('--workers', default=len(CATALOG_TABLES), show_default=True, help='Tables exported in parallel.')
+def export(output_dir, file_format, compress, tables, resume, end_id, batch_size, workers):
+    """Exports venues, artists and shows to NDJSON or CSV files.
+
+    Every file has a .checkpoint file next to it recording the last id written. An interrupted export is resumed
+    with --resume, which drops what was written after the checkpoint and continues each table after its own last
+    id. Resuming a finished export appends the rows added since.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tables = tables or list(CATALOG_TABLES)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            name: executor.submit(_export_table, name, _catalog_path(output_dir, name, file_format, compress),
+                                  file_format, resume, end_id, batch_size)
+            for name in tables
+        }
+    for name, future in futures.items():
+        count, last_id = future.result()
+        click.echo(f'{name}: exported {count} rows to {_catalog_path(output_dir, name, file_format, compress)}, '
+                   f'last id {last_id}')
+
+
+class RejectedRow(Exception):
+    pass
+
+
+def _read_catalog_file(path):
+    """
+    Yields the records of a NDJSON or CSV file (optionally gzipped) as (line number, record, error) tuples. A record is
+    a dict with a None error, a NDJSON line which isn't a JSON object is yielded as its text with the error
+    """
+    with _open_catalog_file(path, 'r') as records:
+        if '.csv' in os.path.basename(path):
+            reader = csv.DictReader(records)
+            for record in reader:
+                yield reader.line_num, record, None
+        else:
+            for line, text in enumerate(records, start=1):
+                text = text.rstrip('\r\n')
+                if not text.strip():
+                    continue
+                try:
+                    record = json.loads(text)
+                except json.JSONDecodeError as ex:
+                    yield line, text, f'invalid JSON at column {ex.colno}: {ex.msg}'
+                    continue
+                if isinstance(record, dict):
+                    yield line, record, None
+                else:
+                    yield line, record, 'not a JSON object'
+
+
+def _coerce(column, value):
+    """
+    Converts a value read from NDJSON or CSV to the python type of the column. CSV values are all strings, with empty
+    strings for NULL and JSON for arrays
+    """
+    if value == '' and not isinstance(column.type, ARRAY):
+        return None
+    if value is None or not isinstance(value, str):
+        return value
+    if isinstance(column.type, ARRAY):
+        return json.loads(value) if value else None
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, Integer):
+        return int(value)
+    if isinstance(column.type, Boolean):
+        return value.lower() in ('true', 't', '1', 'yes')
+    return value
+
+
+def _prepare_row(table, record, now) -> dict:
+    """
+    Converts a record to the column values to insert. Raises RejectedRow if a value can't be converted or a required
+    value is missing
+    """
+    row = {}
+    for column in table.c:
+        # the location of a venue follows from its city and state, see _assign_locations
+        if column.computed is not None or column.key == 'location_id':
+            continue
+        try:
+            value = _coerce(column, record.get(column.key))
+        except ValueError as ex:
+            raise RejectedRow(f'invalid {column.key}: {ex}')
+        if value is None and column.key in ('created_date', 'updated_date'):
+            value = now
+        if value is None and (column.primary_key or column.server_default is not None):
+            continue
+        if value is None and not column.nullable:
+            raise RejectedRow(f'{column.key} is required')
+        row[column.key] = value
+    return row
+
+
+def _sync_id_sequence(conn, table):
+    """
+    Moves the id sequence of a table past its greatest id, rows inserted with their ids don't advance it
+    """
+    conn.execute(text(f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', 'id'), "
+                      f'(SELECT coalesce(max(id), 0) + 1 FROM "{table.name}"), false)'))
+
+
+def _insert_batch(conn, table, batch, reject) -> list:
+    """
+    Inserts a batch of (line, row) tuples with one executemany per set of columns. If the batch violates a constraint
+    the rows are retried one by one so that only the offending ones are rejected
+    :return: Ids of the inserted rows
+    """
+    groups = {}
+    for line, row in batch:
+        groups.setdefault(tuple(row), []).append((line, row))
+
+    ids = []
+    # rows with their own ids go first, so that the rows without one get ids from the synced sequence
+    for columns, rows in sorted(groups.items(), key=lambda group: 'id' not in group[0]):
+        if 'id' not in columns:
+            _sync_id_sequence(conn, table)
+        statement = table.insert().returning(table.c.id)
+        try:
+            with conn.begin_nested():
+                ids.extend(conn.execute(statement, [row for _, row in rows]).scalars())
+        except DBAPIError:
+            for line, row in rows:
+                try:
+                    with conn.begin_nested():
+                        ids.extend(conn.execute(statement, row).scalars())
+                except DBAPIError as ex:
+                    reject(line, row, str(ex.orig).strip())
+    return ids
+
+
+def _refresh_show_counts(conn, batch):
+    """
+    Recomputes the show counters of the venues and artists of a batch of (line, row) show tuples
+    """
+    now = datetime.now()
+    venue_ids = {row['venue_id'] for _, row in batch}
+    artist_ids = {row['artist_id'] for _, row in batch}
+    # locked in the order of helpers.refresh_show_counts
+    conn.execute(helpers.lock_rows(Venue, Venue.id.in_(venue_ids)))
+    conn.execute(helpers.show_counts_update(Venue, Venue.id.in_(venue_ids), now))
+    locations = Location.id.in_(select(Venue.location_id).where(Venue.id.in_(venue_ids)))
+    conn.execute(helpers.lock_rows(Location, locations))
+    conn.execute(helpers.location_counts_update(locations))
+    conn.execute(helpers.lock_rows(Artist, Artist.id.in_(artist_ids)))
+    conn.execute(helpers.show_counts_update(Artist, Artist.id.in_(artist_ids), now))
+
+
+def _assign_locations(conn, venue_ids):
+    """
+    Sets the location of the imported venues from their city and state, creating the missing locations
+    """
+    for statement in helpers.assign_locations_statements(Venue.id.in_(venue_ids)):
+        conn.execute(statement)
+
+
+def _import_table(conn, table_name, path, batch_size, known_ids, report) -> tuple:
+    """
+    Imports a NDJSON or CSV file into a table in batches, committing after every batch. Show artist and venue ids are
+    checked against the known id sets instead of being looked up row by row
+    :return: Tuple of (number of rows imported, number of rows rejected)
+    """
+    table = CATALOG_TABLES[table_name]
+    now = datetime.utcnow()
+    imported, rejected = 0, 0
+
+    def reject(line, record, reason):
+        nonlocal rejected
+        rejected += 1
+        report.write(json.dumps({'file': path, 'line': line, 'reason': reason, 'record': record},
+                                default=helpers.json_default) + '\n')
+
+    def flush(batch):
+        nonlocal imported
+        ids = _insert_batch(conn, table, batch, reject)
+        if table_name == 'shows':
+            _refresh_show_counts(conn, batch)
+        if table_name == 'venues':
+            _assign_locations(conn, ids)
+        conn.commit()
+        imported += len(ids)
+        if table_name in known_ids:
+            known_ids[table_name].update(ids)
+        click.echo(f'{table_name}: {imported} rows imported, {rejected} rejected', err=True)
+
+    batch = []
+    for line, record, error in _read_catalog_file(path):
+        try:
+            if error:
+                raise RejectedRow(error)
+            row = _prepare_row(table, record, now)
+            if table_name == 'shows' and row['artist_id'] not in known_ids['artists']:
+                raise RejectedRow(f"artist {row['artist_id']} doesn't exist")
+            if table_name == 'shows' and row['venue_id'] not in known_ids['venues']:
+                raise RejectedRow(f"venue {row['venue_id']} doesn't exist")
+        except RejectedRow as ex:
+            reject(line, record, str(ex))
+            continue
+        batch.append((line, row))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    _sync_id_sequence(conn, table)
+    conn.commit()
+    return imported, rejected
+
+
+@app.cli.command('import')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=5000, show_default=True, help='Rows inserted per statement.')
+@click.option('--report', default='import-rejected.ndjson', show_default=True, type=click.Path(dir_okay=False),
+              help='File the rejected rows are written to, with the reason.')
+def import_catalog(paths, batch_size, report):
+    """Imports venues, artists and shows from NDJSON or CSV files.
+
+    Files are named after their table like the export output, e.g. venues.ndjson or shows.csv.gz, and are imported
+    in foreign key order.
+    """
+    files = {}
+    for path in paths:
+        table_name = os.path.basename(path).split('.')[0]
+        if table_name not in CATALOG_TABLES:
+            raise click.BadParameter(f"{path} isn't named after one of {', '.join(CATALOG_TABLES)}")
+        files[table_name] = path
+
+    with db.engine.connect() as conn, open(report, 'w') as report_file:
+        # ids shows may reference, extended with the ids of the venues and artists imported in this run
+        known_ids = {'venues': set(), 'artists': set()}
+        if 'shows' in files:
+            known_ids['venues'] = set(conn.execute(select(Venue.id)).scalars())
+            known_ids['artists'] = set(conn.execute(select(Artist.id)).scalars())
+            conn.commit()
+        for table_name in CATALOG_TABLES:
+            if table_name in files:
+                imported, rejected = _import_table(conn, table_name, files[table_name], batch_size, known_ids,
+                                                   report_file)
+                click.echo(f'{table_name}: imported {imported} rows, rejected {rejected}')
+
+
+@app.cli.command('sweep-show-counters')
+@click.option('--full', is_flag=True, help='Recompute the counters of all venues and artists.')
+def sweep_show_counters(full):
+    """Moves the shows which started since the last sweep from the upcoming to the past counters.
+
+    Run it periodically, e.g. every few minutes from cron, the counters are as current as the last sweep.
+    """
+    venues, artists = helpers.sweep_show_counts(datetime.now(), full)
+    db.session.commit()
+    click.echo(f'updated the show counters of {venues} venues and {artists} artists')
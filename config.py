@@ -1,6 +1,9 @@
 import os
 
-SECRET_KEY = os.urandom(32)
+# Key signing the session cookie, which also carries the read your writes marker of the replica routing (see
+# routing.py). Every worker process has to use the same key, with the random default each process only accepts the
+# cookies it signed itself
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -9,6 +12,73 @@ DEBUG = False
 
 # Connect to the database
 
-SQLALCHEMY_DATABASE_URI = 'postgresql://postgres@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://postgres@localhost:5432/fyyur')
 
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Connection pool of every worker process (see pool.py). DB_POOL_SIZE connections are kept open and up to
+# DB_MAX_OVERFLOW more are opened under load; a request waits up to DB_POOL_TIMEOUT seconds for a free connection.
+# Connections are replaced after DB_POOL_RECYCLE seconds and, with DB_POOL_PRE_PING, tested before use so that
+# connections dropped by the server or a proxy aren't handed out. Statements running longer than
+# DB_STATEMENT_TIMEOUT_MS are cancelled by the server, 0 disables the timeout
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+
+SQLALCHEMY_ENGINE_OPTIONS = {
+    'pool_size': DB_POOL_SIZE,
+    'max_overflow': DB_MAX_OVERFLOW,
+    'pool_timeout': DB_POOL_TIMEOUT,
+    'pool_recycle': DB_POOL_RECYCLE,
+    'pool_pre_ping': DB_POOL_PRE_PING,
+    'connect_args': {'options': '-c statement_timeout=%d' % DB_STATEMENT_TIMEOUT_MS},
+}
+
+# Read replicas as comma separated database URLs, read only handlers read from them (see routing.py). Replicas lagging
+# behind the primary more than REPLICA_MAX_LAG_SECONDS are skipped, the lag is checked every REPLICA_LAG_CHECK_SECONDS
+DATABASE_REPLICA_URLS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+SQLALCHEMY_BINDS = {'replica_%d' % i: url for i, url in enumerate(DATABASE_REPLICA_URLS)}
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+REPLICA_LAG_CHECK_SECONDS = float(os.environ.get('REPLICA_LAG_CHECK_SECONDS', 5))
+
+# Number of rows shown per page on the listing pages
+PAGE_SIZE = 50
+
+# Maximum number of results returned by a search
+SEARCH_RESULT_LIMIT = 50
+
+# Days shown by the show calendar by default and at most
+SHOW_CALENDAR_DAYS = 7
+SHOW_CALENDAR_MAX_DAYS = 31
+
+# 'postgres' searches with the pg_trgm indexes, 'ngram' with the in-process index (see search_index.py) for databases
+# without pg_trgm
+SEARCH_BACKEND = 'postgres'
+
+# Seconds after which the in-process search index is rebuilt from the database, None to never rebuild
+SEARCH_INDEX_MAX_AGE = 300
+
+# Cache of the venue and artist page data. Writes invalidate the cache of the process handling them, the TTL bounds
+# how long other processes serve stale data
+PAGE_CACHE_MAX_ENTRIES = 10000
+PAGE_CACHE_TTL = 60
+
+# Seconds after which the recently listed feeds of the home page are reloaded from the database
+RECENT_FEED_RECONCILE_SECONDS = 60
+
+# Cache of rendered template fragments ({% cache %} tag). Keys carry the last modified time of what they render, so
+# the TTL only bounds how long unused fragments are kept
+FRAGMENT_CACHE_MAX_ENTRIES = 50000
+FRAGMENT_CACHE_TTL = 3600
+
+# Send the SQL statement count and time of every request as X-SQL-* response headers (see instrumentation.py)
+SQL_STATS_HEADERS = DEBUG
+
+# A statement running more than this many times in one request is logged as a likely N+1 query
+SQL_N_PLUS_ONE_THRESHOLD = 10
+
+# Number of rows fetched from the server side cursor and sent at once by the streaming JSON API
+API_STREAM_BATCH_SIZE = 1000
@@ -1,14 +1,18 @@
-from fabric.api import local, settings, abort
+from fabric.api import local, settings, abort, shell_env
 from fabric.contrib.console import confirm
 
+# database the tests and benchmarks run against, it is emptied on every run
+BENCHMARK_DATABASE_URL = "postgresql://postgres@localhost:5432/fyyur_bench"
+
 
 # prepare for deployment
 
 
 def test():
-    with settings(warn_only=True):
+    with settings(warn_only=True), shell_env(DATABASE_URL=BENCHMARK_DATABASE_URL, FLASK_APP="app.py"):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "flask db upgrade && python -m pytest -q tests && python -m benchmarks.seed --shows 1000 --reset"
+            " && python -m benchmarks.routes --baseline shows-1k", capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
@@ -0,0 +1,76 @@
+# Recently listed feeds shown on the home page
+#
+# Every process keeps the newest venues and artists in memory. The create, edit and delete handlers keep the feeds
+# of their own process current, every RECENT_FEED_RECONCILE_SECONDS the feeds are reloaded from the database to pick
+# up writes made by other processes.
+
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+
+from helpers import get_recently_listed_venues, get_recently_listed_artists
+
+FEED_SIZE = 10
+
+
+class RecentFeed:
+    """
+    Ring buffer of the serialized FEED_SIZE most recently listed entities, newest first
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self._entries = deque(maxlen=FEED_SIZE)
+        self._synced_at = None
+        self._lock = threading.Lock()
+
+    def reconcile(self):
+        """
+        Reloads the feed from the database
+        """
+        entries = [e.short_serialize for e in self._load(FEED_SIZE)]
+        with self._lock:
+            self._entries = deque(entries, maxlen=FEED_SIZE)
+            self._synced_at = time.monotonic()
+
+    def items(self) -> list:
+        """
+        Returns the feed, reloading it first if it is due for reconciliation
+        :return: List of serialized entities, newest first
+        """
+        interval = current_app.config['RECENT_FEED_RECONCILE_SECONDS']
+        if self._synced_at is None or time.monotonic() - self._synced_at > interval:
+            self.reconcile()
+        with self._lock:
+            return list(self._entries)
+
+    def push(self, entity):
+        """
+        Adds a newly listed entity to the front of the feed, the oldest entry drops out
+        """
+        with self._lock:
+            self._entries.appendleft(entity.short_serialize)
+
+    def rename(self, entity_id, name):
+        """
+        Updates the name of an entity if it is in the feed
+        """
+        with self._lock:
+            for entry in self._entries:
+                if entry['id'] == entity_id:
+                    entry['name'] = name
+
+    def remove(self, entity_id):
+        """
+        Removes a deleted entity from the feed. The feed is then one short, so it is reloaded on the next read
+        """
+        with self._lock:
+            if any(entry['id'] == entity_id for entry in self._entries):
+                self._entries = deque((e for e in self._entries if e['id'] != entity_id), maxlen=FEED_SIZE)
+                self._synced_at = None
+
+
+recent_venues = RecentFeed(get_recently_listed_venues)
+recent_artists = RecentFeed(get_recently_listed_artists)
@@ -1,9 +1,12 @@
 from datetime import datetime
 
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, TextAreaField, \
+    IntegerField
 from wtforms.validators import DataRequired, URL, NumberRange
 
+from models import DEFAULT_SHOW_DURATION_MINUTES
+
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -17,6 +20,18 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default=datetime.today()
     )
+    duration_minutes = IntegerField(
+        'duration_minutes',
+        validators=[DataRequired(), NumberRange(min=1, max=24 * 60)],
+        default=DEFAULT_SHOW_DURATION_MINUTES
+    )
+
+
+class BatchShowForm(Form):
+    # one show per line: artist_id, venue_id, start_time and optionally duration_minutes
+    shows = TextAreaField(
+        'shows', validators=[DataRequired()]
+    )
 
 
 class VenueForm(Form):
@@ -1,61 +1,252 @@
 # Helper Methods
 
-from datetime import datetime
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime, timedelta
+from itertools import groupby
 
-from models import Venue, Show, db, Artist
+from flask import abort, current_app
+from sqlalchemy import and_, bindparam, column, func, insert, literal, literal_column, select, true, tuple_, \
+    union_all, update, DateTime, Integer
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.orm import contains_eager, joinedload
 
-def get_venues_by_distinct_locations() -> list:
+import search_index
+from models import Venue, Show, db, Artist, ShowCounterSweep, Location, location_key
+
+# Expressions of the unique index on Location, the target of the inserts creating missing locations
+LOCATION_KEY = [location_key(Location.state), location_key(Location.city)]
+
+# A page of results along with the opaque cursors pointing to the neighbouring pages (None if there is no such page)
+Page = namedtuple('Page', ['items', 'next_cursor', 'prev_cursor'])
+
+
+def json_default(value):
     """
-    Returns a list of Venues by distinct locations
-    :return: List of Venue objects
+    JSON encoder for the values json doesn't handle itself, datetimes are encoded in ISO 8601
+    :param value: Value to encode
+    :return: JSON serializable value
     """
-    return Venue.query.distinct(Venue.city, Venue.state).all()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
 
 
-def get_venues_by_location(city, state) -> list:
+def encode_cursor(values) -> str:
     """
-    Returns list of venues filtered by city and state
-    :param city: name of city
-    :param state: name of state
-    :return: List of Venue object
+    Encodes the keyset values of a row into an opaque url safe cursor
+    :param values: Tuple of key column values
+    :return: Cursor string
     """
-    return Venue.query.filter_by(city=city, state=state).all()
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
 
 
-def get_past_shows_at_venue(venue_id) -> list:
+def decode_cursor(cursor, columns) -> tuple:
     """
-    Returns list of Past shows at the Venue
-    :param venue_id: Venue id (pk)
-    :return: List of Venue object
+    Decodes a cursor created by encode_cursor back into key column values. Aborts with 400 if the cursor is malformed
+    :param cursor: Cursor string
+    :param columns: Key columns the cursor was created for
+    :return: Tuple of key column values
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(values) != len(columns):
+            raise ValueError('cursor does not match the key columns')
+        return tuple(datetime.fromisoformat(v) if isinstance(c.type, DateTime) else v
+                     for v, c in zip(values, columns))
+    except (ValueError, TypeError):
+        abort(400)
+
+
+def paginate_by_keyset(query, columns, cursor=None, direction='next', page_size=None, key=None) -> Page:
+    """
+    Paginates a query on the given key columns using keyset (seek) pagination. Instead of an OFFSET the page is
+    located by comparing the key columns with the cursor, so any page costs the same as the first one as long as the
+    key columns are indexed. The key columns must be non null and together unique (end them with the primary key)
+    :param query: Query to paginate. It must not be ordered already
+    :param columns: Key columns to order and seek on
+    :param cursor: Cursor of the page boundary, None for the first page
+    :param direction: 'next' to fetch rows after the cursor, 'prev' to fetch rows before it
+    :param page_size: Number of rows per page, defaults to the PAGE_SIZE config
+    :param key: Function returning the key column values of a result row, defaults to reading them as attributes
+    :return: Page of rows
     """
-    return db.session.query(Show).filter(Show.start_time < datetime.now(), Show.venue_id == venue_id).all()
+    page_size = page_size or current_app.config['PAGE_SIZE']
+    key = key or (lambda row: tuple(getattr(row, c.key) for c in columns))
+    backwards = direction == 'prev' and cursor is not None
+
+    if cursor is not None:
+        values = decode_cursor(cursor, columns)
+        keyset = tuple_(*columns)
+        query = query.filter(keyset < tuple_(*values) if backwards else keyset > tuple_(*values))
+    order_by = [c.desc() for c in columns] if backwards else columns
+    rows = query.order_by(*order_by).limit(page_size + 1).all()
+
+    has_more = len(rows) > page_size
+    items = rows[:page_size]
+    if backwards:
+        items.reverse()
+        prev_cursor = encode_cursor(key(items[0])) if has_more else None
+        next_cursor = encode_cursor(key(items[-1])) if items else None
+    else:
+        prev_cursor = encode_cursor(key(items[0])) if cursor is not None and items else None
+        next_cursor = encode_cursor(key(items[-1])) if has_more else None
+    return Page(items, next_cursor, prev_cursor)
 
 
-def get_upcoming_shows_at_venue(venue_id) -> list:
+def get_venues_grouped_by_location(cursor=None, direction='next') -> Page:
     """
-    Returns list of Upcoming shows at the Venue
+    Returns a page of venues grouped by their location along with their stored upcoming show counts. Venues are
+    fetched in a single query ordered by location id, with the city, state and stored aggregates of their location, and
+    grouped in Python, so the number of queries does not grow with the number of areas. An area may continue on the
+    next page, its counts are those of the whole area. Venues without a location come first, as one area
+    :param cursor: Page cursor, None for the first page
+    :param direction: 'next' or 'prev'
+    :return: Page of area dicts (location_id, city, state, venue_count, upcoming_shows_count, venues)
+    """
+    # venues without a location are keyed on 0, as a null key never compares greater than a cursor. The expression
+    # matches the one ix_Venue_location_key_id is indexed on
+    location = func.coalesce(Venue.location_id, literal_column('0'))
+    query = db.session.query(Venue.id, Venue.name, Venue.updated_date,
+                             Venue.upcoming_shows_count.label('num_upcoming_shows'), Venue.location_id,
+                             Location.city, Location.state, Location.venue_count, Location.upcoming_shows_count) \
+        .outerjoin(Location, Location.id == Venue.location_id)
+    page = paginate_by_keyset(query, [location, Venue.id], cursor, direction,
+                              key=lambda row: (row.location_id or 0, row.id))
+
+    areas = []
+    for location_id, venues_in_area in groupby(page.items, key=lambda row: row.location_id):
+        rows = list(venues_in_area)
+        venues = [{
+            'id': row.id,
+            'name': row.name,
+            'last_modified': row.updated_date,
+            'num_upcoming_shows': row.num_upcoming_shows
+        } for row in rows]
+        areas.append({
+            'location_id': location_id,
+            'city': rows[0].city,
+            'state': rows[0].state,
+            'venues': venues,
+            # venues without a location only have the counts of this page
+            'venue_count': rows[0].venue_count if location_id else len(venues),
+            'upcoming_shows_count': rows[0].upcoming_shows_count if location_id
+            else sum(v['num_upcoming_shows'] for v in venues)
+        })
+    return page._replace(items=areas)
+
+
+def get_location_by_id(location_id) -> Location:
+    """
+    Returns Location identified by the location id
+    :param location_id: Location id (pk)
+    :return: Location object
+    """
+    return Location.query.filter_by(id=location_id).first_or_404()
+
+
+def get_venues_page_at_location(location_id, cursor=None, direction='next') -> Page:
+    """
+    Returns a page of the venues at the Location ordered by id, read from the location_id, id index
+    :param location_id: Location id (pk)
+    :param cursor: Page cursor, None for the first page
+    :param direction: 'next' or 'prev'
+    :return: Page of Venue objects
+    """
+    return paginate_by_keyset(Venue.query.filter(Venue.location_id == location_id), [Venue.id], cursor, direction)
+
+
+def get_location_id(city, state):
+    """
+    Returns the id of the Location of a city and state, creating it if there is none yet. Cities and states are matched
+    trimmed and in lower case, see models.location_key. The caller commits
+    :param city: City
+    :param state: State
+    :return: Location id (pk), None if city or state is empty
+    """
+    city, state = (city or '').strip(), (state or '').strip()
+    if not city or not state:
+        return None
+    query = select(Location.id).where(location_key(Location.state) == location_key(literal(state)),
+                                      location_key(Location.city) == location_key(literal(city)))
+    location_id = db.session.execute(query).scalar()
+    if location_id is None:
+        # a concurrent request may create the same location
+        db.session.execute(pg_insert(Location).values(city=city, state=state)
+                           .on_conflict_do_nothing(index_elements=LOCATION_KEY))
+        location_id = db.session.execute(query).scalar()
+    return location_id
+
+
+def get_shows_at_venue(venue_id) -> list:
+    """
+    Returns all shows at the Venue ordered by start time, with their artists loaded in the same query
     :param venue_id: Venue id (pk)
-    :return: List of Venue object
-   """
-    return db.session.query(Show).filter(Show.start_time > datetime.now(), Show.venue_id == venue_id).all()
+    :return: List of Show objects
+    """
+    return db.session.query(Show).options(joinedload(Show.artist)) \
+        .filter(Show.venue_id == venue_id).order_by(Show.start_time).all()
 
 
-def get_past_shows_of_artist(artist_id) -> list:
+def get_shows_of_artist(artist_id) -> list:
     """
-    Returns list of Past shows for the Artist
+    Returns all shows of the Artist ordered by start time, with their venues loaded in the same query
     :param artist_id: Artist id (pk)
-    :return: List of Artist Objects
+    :return: List of Show objects
     """
-    return db.session.query(Show).filter(Show.start_time <= datetime.now(), Show.artist_id == artist_id).all()
+    return db.session.query(Show).options(joinedload(Show.venue)) \
+        .filter(Show.artist_id == artist_id).order_by(Show.start_time).all()
 
 
-def get_upcoming_shows_of_artist(artist_id) -> list:
+def get_artist_ids_with_shows_at_venue(venue_id) -> list:
     """
-    Returns list of Upcoming shows for the Artist
+    Returns the ids of the artists having shows at the Venue
+    :param venue_id: Venue id (pk)
+    :return: List of Artist ids
+    """
+    return [row.artist_id for row in db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+
+
+def get_venue_ids_with_shows_of_artist(artist_id) -> list:
+    """
+    Returns the ids of the venues where the Artist has shows
     :param artist_id: Artist id (pk)
-    :return: List of Artist Objects
+    :return: List of Venue ids
+    """
+    return [row.venue_id for row in db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()]
+
+
+def partition_shows(shows, now) -> tuple:
+    """
+    Splits shows into past and upcoming shows in a single pass. Shows starting at or after now are upcoming
+    :param shows: List of Show objects
+    :param now: Reference timestamp, the same one has to be used for every list shown on a page
+    :return: Tuple of (past shows, upcoming shows)
+    """
+    past_shows, upcoming_shows = [], []
+    for show in shows:
+        (past_shows if show.start_time < now else upcoming_shows).append(show)
+    return past_shows, upcoming_shows
+
+
+def get_recently_listed_venues(limit=10) -> list:
+    """
+    Returns the most recently listed venues
+    :param limit: Number of venues to return
+    :return: List of Venue objects
+    """
+    return Venue.query.order_by(Venue.created_date.desc(), Venue.id.desc()).limit(limit).all()
+
+
+def get_recently_listed_artists(limit=10) -> list:
+    """
+    Returns the most recently listed artists
+    :param limit: Number of artists to return
+    :return: List of Artist objects
     """
-    return db.session.query(Show).filter(Show.start_time > datetime.now(), Show.artist_id == artist_id).all()
+    return Artist.query.order_by(Artist.created_date.desc(), Artist.id.desc()).limit(limit).all()
 
 
 def get_venue_by_id(venue_id) -> Venue:
@@ -76,13 +267,55 @@ def get_artist_by_id(artist_id) -> Artist:
     return Artist.query.filter_by(id=artist_id).first_or_404()
 
 
+def escape_like(text) -> str:
+    """
+    Escapes the LIKE wildcards in user supplied text so that it is matched literally
+    :param text: Text to escape
+    :return: Escaped text, to be used with escape='\\'
+    """
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def get_by_ids(model, ids) -> list:
+    """
+    Returns the objects identified by the ids, in the order of the ids
+    :param model: Model class
+    :param ids: List of ids (pk)
+    :return: List of model objects
+    """
+    if not ids:
+        return []
+    objects = {o.id: o for o in model.query.filter(model.id.in_(ids)).all()}
+    return [objects[i] for i in ids if i in objects]
+
+
+def search_by_name(model, search_term) -> list:
+    """
+    Searches a Venue or Artist by partial text match on the name. With the 'postgres' SEARCH_BACKEND the match is
+    served by the trigram index on name and results are ranked by their trigram similarity with the search term, with
+    the 'ngram' backend the in-process index finds the ids and only the matches are loaded
+    :param model: Venue or Artist
+    :param search_term: Search term
+    :return: List of model objects, at most SEARCH_RESULT_LIMIT
+    """
+    limit = current_app.config['SEARCH_RESULT_LIMIT']
+    if current_app.config['SEARCH_BACKEND'] == 'ngram':
+        index = search_index.venue_index if model is Venue else search_index.artist_index
+        return get_by_ids(model, index.search(search_term, limit))
+    return model.query \
+        .filter(model.name.ilike(f'%{escape_like(search_term)}%', escape='\\')) \
+        .order_by(func.similarity(model.name, search_term).desc(), model.id) \
+        .limit(limit) \
+        .all()
+
+
 def search_venue(search_term) -> list:
     """
     Searches venue by partial text. Venues are searched by name.
     :param search_term: Search term with which we want to search
     :return: List of Venue
     """
-    return Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()
+    return search_by_name(Venue, search_term)
 
 
 def search_artist(search_term) -> list:
@@ -91,7 +324,271 @@ def search_artist(search_term) -> list:
     :param search_term: Search term
     :return: List of Artist objects
     """
-    return Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).all()
+    return search_by_name(Artist, search_term)
+
+
+def get_shows_page(cursor=None, direction='next') -> Page:
+    """
+    Returns a page of shows ordered by start time, with their artist and venue loaded in the same query
+    :param cursor: Page cursor, None for the first page
+    :param direction: 'next' or 'prev'
+    :return: Page of Show objects
+    """
+    query = Show.query.options(joinedload(Show.artist), joinedload(Show.venue))
+    return paginate_by_keyset(query, [Show.start_time, Show.id], cursor, direction)
+
+
+def get_shows_between(start, end, location_id=None, venue_id=None):
+    """
+    Returns the query for the shows starting in [start, end), ordered by start time, with their artist and venue loaded
+    in the same query. The range is read from the start_time index, or from the venue_id, start_time index for a single
+    venue
+    :param start: Start of the window, inclusive
+    :param end: End of the window, exclusive
+    :param location_id: Only shows at venues at this location (pk), None for any location
+    :param venue_id: Only shows at this venue (pk), None for any venue
+    :return: Query of Show objects
+    """
+    query = Show.query.join(Show.venue).join(Show.artist) \
+        .options(contains_eager(Show.venue), contains_eager(Show.artist)) \
+        .filter(Show.start_time >= start, Show.start_time < end)
+    if location_id is not None:
+        query = query.filter(Venue.location_id == location_id)
+    if venue_id is not None:
+        query = query.filter(Show.venue_id == venue_id)
+    return query.order_by(Show.start_time, Show.id)
+
+
+def get_artists_page(cursor=None, direction='next') -> Page:
+    """
+    Returns a page of artists ordered by the date they were listed
+    :param cursor: Page cursor, None for the first page
+    :param direction: 'next' or 'prev'
+    :return: Page of Artist objects
+    """
+    return paginate_by_keyset(Artist.query, [Artist.created_date, Artist.id], cursor, direction)
+
+
+def get_existing_artist_and_venue_ids(artist_ids, venue_ids) -> tuple:
+    """
+    Returns which of the artist and venue ids exist, checked in a single query
+    :param artist_ids: Artist ids (pk) to check
+    :param venue_ids: Venue ids (pk) to check
+    :return: Tuple of (set of existing artist ids, set of existing venue ids)
+    """
+    query = union_all(
+        select(literal('artist').label('kind'), Artist.id).where(Artist.id.in_(artist_ids)),
+        select(literal('venue').label('kind'), Venue.id).where(Venue.id.in_(venue_ids)),
+    )
+    existing = {'artist': set(), 'venue': set()}
+    for kind, entity_id in db.session.execute(query):
+        existing[kind].add(entity_id)
+    return existing['artist'], existing['venue']
+
+
+def insert_shows(shows) -> list:
+    """
+    Inserts the shows in a single statement. The caller commits
+    :param shows: List of dicts with artist_id, venue_id, start_time and duration_minutes
+    :return: Ids of the new shows, in the order of the shows
+    """
+    # the rows may be inserted in several batches, whose RETURNING rows are only in parameter order when asked for
+    return db.session.execute(insert(Show).returning(Show.id, sort_by_parameter_order=True), shows).scalars().all()
+
+
+def get_overlapping_shows(shows) -> list:
+    """
+    Returns the existing shows which overlap the new shows at their venue or with their artist, looked up for all new
+    shows in one query. Every lookup searches the GiST index of the matching exclusion constraint on Show, so it takes
+    logarithmic time instead of scanning the shows of the venue or artist
+    :param shows: List of dicts with artist_id, venue_id, start_time and duration_minutes
+    :return: List with an entry per new show, None if it doesn't overlap, else a tuple of ('venue' or 'artist', id
+    (pk) of the existing show, its start time)
+    """
+    if not shows:
+        return []
+    # the new shows are passed as arrays, so the statement is the same for any number of shows and compiled once
+    new = func.unnest(bindparam('venue_ids', type_=ARRAY(Integer)), bindparam('artist_ids', type_=ARRAY(Integer)),
+                      bindparam('start_times', type_=ARRAY(DateTime)), bindparam('end_times', type_=ARRAY(DateTime))) \
+        .table_valued(column('venue_id', Integer), column('artist_id', Integer), column('start_time', DateTime),
+                      column('end_time', DateTime), with_ordinality='i') \
+        .render_derived(name='new_show')
+    # the expressions match the ones the exclusion constraints are indexed on
+    query = union_all(*(
+        select(new.c.i, literal(kind).label('kind'), Show.id, Show.start_time).join_from(new, Show, and_(
+            func.int4range(key, key, '[]').op('&&')(func.int4range(new.c[key.key], new.c[key.key], '[]')),
+            func.tsrange(Show.start_time, Show.end_time).op('&&')(func.tsrange(new.c.start_time, new.c.end_time))))
+        for kind, key in [('venue', Show.venue_id), ('artist', Show.artist_id)]
+    ))
+    params = {
+        'venue_ids': [s['venue_id'] for s in shows],
+        'artist_ids': [s['artist_id'] for s in shows],
+        'start_times': [s['start_time'] for s in shows],
+        'end_times': [s['start_time'] + timedelta(minutes=s['duration_minutes']) for s in shows],
+    }
+    overlaps = [None] * len(shows)
+    # the ordinality i counts from 1
+    for i, kind, show_id, start_time in db.session.execute(query, params):
+        overlaps[i - 1] = overlaps[i - 1] or (kind, show_id, start_time)
+    return overlaps
+
+
+def get_overlaps_within(shows) -> list:
+    """
+    Returns which of the new shows overlap an earlier one of them at the same venue or with the same artist, by
+    sweeping them in start time order. A show overlapping an earlier one is rejected, so it doesn't count against the
+    shows after it
+    :param shows: List of dicts with artist_id, venue_id, start_time and duration_minutes
+    :return: List with an entry per new show, None if it doesn't overlap, else a tuple of ('venue' or 'artist', index of
+    the show it overlaps)
+    """
+    overlaps = [None] * len(shows)
+    # per venue and per artist, the end time and index of the accepted show ending last
+    latest = {'venue': {}, 'artist': {}}
+    for i in sorted(range(len(shows)), key=lambda i: (shows[i]['start_time'], i)):
+        start = shows[i]['start_time']
+        end = start + timedelta(minutes=shows[i]['duration_minutes'])
+        for kind, ends in latest.items():
+            latest_end, other = ends.get(shows[i][kind + '_id'], (None, None))
+            if latest_end is not None and start < latest_end:
+                overlaps[i] = (kind, other)
+                break
+        if overlaps[i] is None:
+            for kind, ends in latest.items():
+                key = shows[i][kind + '_id']
+                if key not in ends or end > ends[key][0]:
+                    ends[key] = (end, i)
+    return overlaps
+
+
+def lock_rows(model, condition):
+    """
+    Returns a SELECT .. FOR NO KEY UPDATE locking the rows matching the condition in id order. Stored counters are
+    recomputed after locking their rows: in READ COMMITTED the recompute then runs as a separate statement, whose
+    snapshot sees the rows committed by a concurrent write that held the lock, instead of overwriting its counter with a
+    stale count. The lock doesn't block the foreign key checks of rows inserted for them
+    :param model: Model of the rows
+    :param condition: Condition selecting the rows
+    :return: Select statement, executable on a session or a connection
+    """
+    return select(model.id).where(condition).order_by(model.id).with_for_update(key_share=True)
+
+
+def show_counts_update(model, condition, now):
+    """
+    Returns an UPDATE recomputing the stored show counters of the venues or artists matching the condition, with an
+    index range count per entity. The updated date is kept, a changed count isn't an edit of the listing. Lock the rows
+    with lock_rows first
+    :param model: Venue or Artist
+    :param condition: Condition selecting the entities to update
+    :param now: Time separating past from upcoming shows
+    :return: Update statement, executable on a session or a connection
+    """
+    column = Show.venue_id if model is Venue else Show.artist_id
+
+    def count(*criteria):
+        return select(func.count()).where(column == model.id, *criteria).scalar_subquery()
+
+    return update(model.__table__).where(condition).values(
+        past_shows_count=count(Show.start_time < now),
+        upcoming_shows_count=count(Show.start_time >= now),
+        updated_date=model.updated_date,
+    )
+
+
+def location_counts_update(condition):
+    """
+    Returns an UPDATE recomputing the stored venue count and upcoming show count of the locations matching the
+    condition from their venues. Lock the locations with lock_rows first
+    :param condition: Condition selecting the locations to update
+    :return: Update statement, executable on a session or a connection
+    """
+    at_location = Venue.location_id == Location.id
+    return update(Location).where(condition).values(
+        venue_count=select(func.count()).where(at_location).scalar_subquery(),
+        upcoming_shows_count=select(func.coalesce(func.sum(Venue.upcoming_shows_count), 0))
+        .where(at_location).scalar_subquery(),
+    )
+
+
+def assign_locations_statements(condition) -> list:
+    """
+    Returns the statements setting the location of the venues matching the condition from their city and state,
+    creating the missing locations, and recomputing the aggregates of these locations. Used for venues written in bulk,
+    the venue handlers use get_location_id
+    :param condition: Condition selecting the venues
+    :return: List of statements to execute in order, on a session or a connection
+    """
+    with_location = and_(condition, func.btrim(Venue.city) != '', func.btrim(Venue.state) != '')
+    create = pg_insert(Location).from_select(['city', 'state'], select(func.btrim(Venue.city), func.btrim(Venue.state))
+                                             .where(with_location).distinct()) \
+        .on_conflict_do_nothing(index_elements=LOCATION_KEY)
+    assign = update(Venue.__table__).where(with_location, location_key(Location.state) == location_key(Venue.state),
+                                           location_key(Location.city) == location_key(Venue.city)) \
+        .values(location_id=Location.id)
+    locations = Location.id.in_(select(Venue.location_id).where(condition))
+    return [create, assign, lock_rows(Location, locations), location_counts_update(locations)]
+
+
+def refresh_location_counts(location_ids):
+    """
+    Recomputes the stored aggregates of the locations. The caller commits
+    :param location_ids: Location ids (pk), None entries are ignored
+    """
+    location_ids = {location_id for location_id in location_ids if location_id is not None}
+    if location_ids:
+        db.session.execute(lock_rows(Location, Location.id.in_(location_ids)))
+        db.session.execute(location_counts_update(Location.id.in_(location_ids)))
+
+
+def refresh_show_counts(venue_ids=(), artist_ids=()):
+    """
+    Recomputes the stored show counters of the venues and artists, one statement per table, and the aggregates of the
+    locations of the venues. The caller commits
+    :param venue_ids: Venue ids (pk)
+    :param artist_ids: Artist ids (pk)
+    """
+    now = datetime.now()
+    # venues are locked before their locations and artists, like in the sweep and the import
+    if venue_ids:
+        db.session.execute(lock_rows(Venue, Venue.id.in_(venue_ids)))
+        db.session.execute(show_counts_update(Venue, Venue.id.in_(venue_ids), now))
+        locations = Location.id.in_(select(Venue.location_id).where(Venue.id.in_(venue_ids)))
+        db.session.execute(lock_rows(Location, locations))
+        db.session.execute(location_counts_update(locations))
+    if artist_ids:
+        db.session.execute(lock_rows(Artist, Artist.id.in_(artist_ids)))
+        db.session.execute(show_counts_update(Artist, Artist.id.in_(artist_ids), now))
+
+
+def sweep_show_counts(now, full=False) -> tuple:
+    """
+    Moves the shows which started since the last sweep from the upcoming to the past counters, by recomputing the
+    counters of their venues and artists and the aggregates of the locations of the venues. The first sweep, or a full
+    one, recomputes all counters. The caller commits
+    :param now: Time separating past from upcoming shows
+    :param full: Recompute the counters of all venues and artists
+    :return: Tuple of (number of venues updated, number of artists updated)
+    """
+    sweep = db.session.get(ShowCounterSweep, 1)
+    full = full or sweep is None
+    updated = []
+    for model, column in [(Venue, Show.venue_id), (Artist, Show.artist_id)]:
+        if full:
+            condition = true()
+        else:
+            condition = model.id.in_(select(column).where(Show.start_time >= sweep.swept_at, Show.start_time < now))
+        db.session.execute(lock_rows(model, condition))
+        updated.append(db.session.execute(show_counts_update(model, condition, now)).rowcount)
+        if model is Venue:
+            locations = true() if full else Location.id.in_(select(Venue.location_id).where(condition))
+            db.session.execute(lock_rows(Location, locations))
+            db.session.execute(location_counts_update(locations))
+    if sweep is None:
+        db.session.add(ShowCounterSweep(id=1, swept_at=now))
+    else:
+        sweep.swept_at = now
+    return tuple(updated)
 
 
 def get_show_by_id(show_id) -> Show:
@@ -105,10 +602,42 @@ def get_show_by_id(show_id) -> Show:
 
 def search_show(search_term) -> list:
     """
-    Searches show by partial text. Checks for Venues/Artists names matching that partial text
+    Searches show by partial text. Checks for Venues/Artists names matching that partial text. Results are ranked by
+    the better similarity of the names that match. With the 'ngram' SEARCH_BACKEND the matching artists and venues
+    come from the in-process index and shows are ordered by start time
     :param search_term: Search term with which we want to search
     :return: List of shows
     """
-    return Show.query.filter(
-        Show.artist.has(Artist.name.ilike(f'%{search_term}%')) | Show.venue.has(
-            Venue.name.ilike(f'%{search_term}%'))).all()
+    limit = current_app.config['SEARCH_RESULT_LIMIT']
+    if current_app.config['SEARCH_BACKEND'] == 'ngram':
+        # every match may have many shows, so look up more than limit names to fill the page
+        artist_ids = search_index.artist_index.search(search_term, limit * 10)
+        venue_ids = search_index.venue_index.search(search_term, limit * 10)
+        return Show.query.options(joinedload(Show.artist), joinedload(Show.venue)) \
+            .filter(Show.artist_id.in_(artist_ids) | Show.venue_id.in_(venue_ids)) \
+            .order_by(Show.start_time, Show.id) \
+            .limit(limit) \
+            .all()
+
+    pattern = f'%{escape_like(search_term)}%'
+    # the matching artists and venues are found through their trigram indexes, materialized so that their similarity
+    # is computed once per name, and their shows through the artist_id and venue_id indexes of Show. A show is ranked
+    # by the better of its matching names
+    matches = []
+    for model, key in [(Artist, Show.artist_id), (Venue, Show.venue_id)]:
+        names = select(model.id, func.similarity(model.name, search_term).label('rank')) \
+            .where(model.name.ilike(pattern, escape='\\')) \
+            .cte(f'matching_{model.__tablename__.lower()}s').prefix_with('MATERIALIZED')
+        matches.append(select(Show.id.label('show_id'), Show.start_time, names.c.rank)
+                       .join_from(names, Show, key == names.c.id))
+    matches = union_all(*matches).subquery('matches')
+    rank = func.max(matches.c.rank).label('rank')
+    best = select(matches.c.show_id, rank) \
+        .group_by(matches.c.show_id, matches.c.start_time) \
+        .order_by(rank.desc(), matches.c.start_time, matches.c.show_id) \
+        .limit(limit) \
+        .subquery('best')
+    return Show.query.join(best, Show.id == best.c.show_id).join(Show.artist).join(Show.venue) \
+        .options(contains_eager(Show.artist), contains_eager(Show.venue)) \
+        .order_by(best.c.rank.desc(), Show.start_time, Show.id) \
+        .all()
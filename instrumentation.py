@@ -0,0 +1,103 @@
+# Per request SQL instrumentation
+#
+# Counts the statements every request runs on any engine and the time spent in them, grouped by normalized statement
+# text. Each request logs a summary at INFO to the instrumentation logger, which doesn't write to error.log; with
+# SQL_STATS_HEADERS the numbers are also sent as X-SQL-* response headers. A statement running more than
+# SQL_N_PLUS_ONE_THRESHOLD times in one request is logged as a likely N+1 query. The summary is logged when the
+# response is closed, so that the statements a streamed response runs while its body is generated are counted too.
+# Streamed responses get no X-SQL-* headers, as they are sent before the body.
+
+import logging
+import re
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from appconfig import app
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|\$\d+|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(statement) -> str:
+    """
+    Replaces the parameters and literals of a statement by ?, so statements differing only in their values are equal
+    :param statement: SQL statement
+    :return: Normalized statement
+    """
+    statement = _PLACEHOLDER.sub('?', statement)
+    statement = _PLACEHOLDER_LIST.sub('?, ...', statement)
+    return _WHITESPACE.sub(' ', statement).strip()
+
+
+class RequestSQLStats:
+    """
+    Statements run by a request
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[normalize(statement)] += 1
+
+    def repeated(self, threshold) -> list:
+        """
+        Returns the statements which ran more than threshold times, most frequent first
+        :return: List of (normalized statement, count)
+        """
+        return [(statement, count) for statement, count in self.statements.most_common() if count > threshold]
+
+
+def request_sql_stats() -> RequestSQLStats:
+    """
+    Returns the statistics of the statements run by the current request. A streamed response keeps counting into the
+    same object while its body is generated
+    :return: RequestSQLStats of the request
+    """
+    if 'sql_stats' not in g:
+        g.sql_stats = RequestSQLStats()
+    return g.sql_stats
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start_time'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_start_time']
+    if has_request_context():
+        request_sql_stats().record(statement, seconds)
+
+
+def _log_sql_stats(stats, method, path):
+    logger.info('%s %s: %d SQL statements in %.1f ms', method, path, stats.count, stats.seconds * 1000)
+    for statement, count in stats.repeated(app.config['SQL_N_PLUS_ONE_THRESHOLD']):
+        logger.warning('Possible N+1 query in %s %s, statement ran %d times: %s', method, path, count, statement)
+
+
+@app.after_request
+def report_sql_stats(response):
+    stats = request_sql_stats()
+    # called by the WSGI server once the body is sent, after the statements of a streamed body ran
+    response.call_on_close(lambda method=request.method, path=request.path: _log_sql_stats(stats, method, path))
+    if app.config['SQL_STATS_HEADERS'] and not response.is_streamed:
+        repeated = stats.repeated(app.config['SQL_N_PLUS_ONE_THRESHOLD'])
+        response.headers['X-SQL-Count'] = str(stats.count)
+        response.headers['X-SQL-Time-Ms'] = '%.1f' % (stats.seconds * 1000)
+        response.headers['X-SQL-Distinct'] = str(len(stats.statements))
+        if repeated:
+            response.headers['X-SQL-N-Plus-One'] = str(len(repeated))
+    return response
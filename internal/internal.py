@@ -0,0 +1,51 @@
+from flask import Blueprint, Response, jsonify
+
+from appconfig import db
+import metrics
+from cache import page_cache, fragment_cache
+from routing import lag_monitor
+
+internal = Blueprint('internal', __name__)
+
+
+@internal.route('/internal/cache')
+def cache_stats():
+    """
+    Handler to show the cache statistics of this process
+    :return: JSON with the entries, hits, misses and hit ratio of each cache
+    """
+    return jsonify({
+        'page_cache': page_cache.stats,
+        'fragment_cache': fragment_cache.stats,
+    })
+
+
+@internal.route('/internal/pool')
+def pool_stats():
+    """
+    Handler to show the connection pool statistics of this process
+    :return: JSON with the open, checked out and overflow connections and the time spent waiting for a connection
+    """
+    return jsonify(db.engine.pool.stats)
+
+
+@internal.route('/internal/replicas')
+def replica_stats():
+    """
+    Handler to show the read replicas as seen by this process
+    :return: JSON with the last measured lag (None if unreachable) and the pool statistics of each replica
+    """
+    lags = lag_monitor.stats
+    return jsonify({
+        key: {'lag_seconds': lags.get(key), 'pool': engine.pool.stats}
+        for key, engine in db.engines.items() if key is not None
+    })
+
+
+@internal.route('/metrics')
+def prometheus_metrics():
+    """
+    Handler to expose the metrics of this process to Prometheus
+    :return: Metrics in the Prometheus text format
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
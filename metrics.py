@@ -0,0 +1,146 @@
+# Metrics in the Prometheus text format, served at /metrics
+#
+# Histograms of the request latency, the database time and statement count per request (see instrumentation.py) and
+# the template render time, plus the cache statistics. Metrics are per process, every worker has to be scraped.
+
+import threading
+import time
+
+from flask import g, request, before_render_template, template_rendered
+
+from appconfig import app
+from cache import page_cache, fragment_cache
+from instrumentation import request_sql_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Thread safe histogram with fixed buckets and a set of label names
+    """
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """
+        Adds an observation to the series of the label values
+        """
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self) -> list:
+        """
+        Returns the histogram in the Prometheus text format
+        :return: List of lines
+        """
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                labels = dict(zip(self.label_names, label_values))
+                for bound, count in zip(self.buckets, series['buckets']):
+                    lines.append(f'{self.name}_bucket{_format_labels({**labels, "le": bound})} {count}')
+                lines.append(f'{self.name}_bucket{_format_labels({**labels, "le": "+Inf"})} {series["count"]}')
+                lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(series["sum"])}')
+                lines.append(f'{self.name}_count{_format_labels(labels)} {series["count"]}')
+        return lines
+
+
+def _metric(name, metric_type, help_text, samples) -> list:
+    """
+    Returns a gauge or counter in the Prometheus text format
+    :param samples: List of (labels dict, value), samples with value None are left out
+    """
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+    lines.extend(f'{name}{_format_labels(labels)} {_format_value(value)}' for labels, value in samples
+                 if value is not None)
+    return lines
+
+
+request_duration = Histogram('fyyur_request_duration_seconds', 'Request latency by route.',
+                             ['endpoint', 'method', 'status'])
+request_db_duration = Histogram('fyyur_request_db_seconds', 'Time spent in SQL statements per request.',
+                                ['endpoint'])
+request_db_statements = Histogram('fyyur_request_db_statements', 'SQL statements per request.', ['endpoint'],
+                                  STATEMENT_BUCKETS)
+template_render_duration = Histogram('fyyur_template_render_seconds', 'Jinja template render time.', ['template'])
+
+CACHES = {'page': page_cache, 'fragment': fragment_cache}
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+def _observe_request_end(started, stats, endpoint, method, status):
+    request_duration.observe(time.perf_counter() - started, endpoint, method, status)
+    request_db_duration.observe(stats.seconds, endpoint)
+    request_db_statements.observe(stats.count, endpoint)
+
+
+@app.after_request
+def _observe_request(response):
+    if 'request_started' in g:
+        # unmatched urls share one label, so that scanning for urls doesn't create a series per url
+        endpoint = request.endpoint or 'unmatched'
+        args = (g.request_started, request_sql_stats(), endpoint, request.method, str(response.status_code))
+        # observed once the body is sent, so that a streamed body counts with its time and statements
+        response.call_on_close(lambda: _observe_request_end(*args))
+    return response
+
+
+@before_render_template.connect_via(app)
+def _start_render_timer(sender, template, context, **extra):
+    g.setdefault('render_started', []).append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def _observe_render(sender, template, context, **extra):
+    started = g.get('render_started')
+    if started:
+        template_render_duration.observe(time.perf_counter() - started.pop(), template.name)
+
+
+def render() -> str:
+    """
+    Returns all metrics in the Prometheus text format
+    """
+    lines = []
+    for histogram in [request_duration, request_db_duration, request_db_statements, template_render_duration]:
+        lines.extend(histogram.render())
+    stats = {name: cache.stats for name, cache in CACHES.items()}
+    lines.extend(_metric('fyyur_cache_hits_total', 'counter', 'Cache hits since the process started.',
+                         [({'cache': name}, s['hits']) for name, s in stats.items()]))
+    lines.extend(_metric('fyyur_cache_misses_total', 'counter', 'Cache misses since the process started.',
+                         [({'cache': name}, s['misses']) for name, s in stats.items()]))
+    lines.extend(_metric('fyyur_cache_hit_ratio', 'gauge', 'Cache hits per lookup since the process started.',
+                         [({'cache': name}, s['hit_ratio']) for name, s in stats.items()]))
+    lines.extend(_metric('fyyur_cache_entries', 'gauge', 'Entries in the cache.',
+                         [({'cache': name}, s['entries']) for name, s in stats.items()]))
+    return '\n'.join(lines) + '\n'
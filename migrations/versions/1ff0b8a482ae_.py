@@ -0,0 +1,41 @@
+"""add stored show counters to Venue and Artist
+
+Revision ID: 1ff0b8a482ae
+Revises: 71b9e4d0c3a6
+Create Date: 2026-10-18 13:05:41.227318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1ff0b8a482ae'
+down_revision = '71b9e4d0c3a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ['Venue', 'Artist']:
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('ShowCounterSweep',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('swept_at', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    # the backfill counts as of LOCALTIMESTAMP, which is also the time of the first sweep
+    for table, column in [('Venue', 'venue_id'), ('Artist', 'artist_id')]:
+        op.execute(f'UPDATE "{table}" t SET past_shows_count = c.past, upcoming_shows_count = c.upcoming '
+                   f'FROM (SELECT {column} AS id, count(*) FILTER (WHERE start_time < LOCALTIMESTAMP) AS past, '
+                   'count(*) FILTER (WHERE start_time >= LOCALTIMESTAMP) AS upcoming '
+                   f'FROM "Show" GROUP BY {column}) c WHERE c.id = t.id')
+    op.execute('INSERT INTO "ShowCounterSweep" (id, swept_at) VALUES (1, LOCALTIMESTAMP)')
+
+
+def downgrade():
+    op.drop_table('ShowCounterSweep')
+    for table in ['Artist', 'Venue']:
+        op.drop_column(table, 'upcoming_shows_count')
+        op.drop_column(table, 'past_shows_count')
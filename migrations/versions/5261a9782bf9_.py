@@ -0,0 +1,53 @@
+"""add show durations and exclude overlapping shows per venue and artist
+
+Revision ID: 5261a9782bf9
+Revises: 1ff0b8a482ae
+Create Date: 2026-10-18 15:20:12.604718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5261a9782bf9'
+down_revision = '1ff0b8a482ae'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # shows starting less than a minute before the next show at the venue or of the artist are duplicate bookings,
+    # which can't be given a valid duration. They have to be resolved by hand before upgrading. Not a RuntimeError,
+    # Flask-Migrate would catch it and log it to a logger the alembic logging configuration disabled
+    duplicates = op.get_bind().execute(sa.text(
+        'SELECT id FROM (SELECT id, start_time, '
+        'least(lead(start_time) OVER (PARTITION BY venue_id ORDER BY start_time, id), '
+        'lead(start_time) OVER (PARTITION BY artist_id ORDER BY start_time, id)) AS next_start FROM "Show") n '
+        "WHERE next_start < start_time + interval '1 minute' ORDER BY id")).scalars().all()
+    if duplicates:
+        raise ValueError('Shows starting less than a minute before another show at the venue or of the artist: '
+                         + ', '.join(map(str, duplicates)))
+    op.add_column('Show', sa.Column('duration_minutes', sa.Integer(), server_default='120', nullable=False))
+    # existing shows are cut short where the next show at the venue or of the artist starts within the default
+    # duration, so that the constraints below hold
+    op.execute('UPDATE "Show" s SET duration_minutes = floor(extract(epoch FROM n.next_start - s.start_time) / 60) '
+               'FROM (SELECT id, least(lead(start_time) OVER (PARTITION BY venue_id ORDER BY start_time, id), '
+               'lead(start_time) OVER (PARTITION BY artist_id ORDER BY start_time, id)) AS next_start '
+               'FROM "Show") n '
+               "WHERE n.id = s.id AND n.next_start < s.start_time + s.duration_minutes * interval '1 minute'")
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(),
+                                    sa.Computed("start_time + duration_minutes * interval '1 minute'"),
+                                    nullable=False))
+    op.create_check_constraint('ck_Show_duration_minutes', 'Show', 'duration_minutes >= 1')
+    for column in ['venue_id', 'artist_id']:
+        op.execute(f'ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_{column}_period" EXCLUDE USING gist '
+                   f"(int4range({column}, {column}, '[]') WITH &&, tsrange(start_time, end_time) WITH &&)")
+
+
+def downgrade():
+    op.drop_constraint('ex_Show_artist_id_period', 'Show')
+    op.drop_constraint('ex_Show_venue_id_period', 'Show')
+    op.drop_constraint('ck_Show_duration_minutes', 'Show')
+    op.drop_column('Show', 'end_time')
+    op.drop_column('Show', 'duration_minutes')
@@ -0,0 +1,36 @@
+"""add indexes for show time, foreign key and listing lookups
+
+Revision ID: 5d0e6a2b7f41
+Revises: c144451e249a
+Create Date: 2026-10-18 10:31:07.562913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0e6a2b7f41'
+down_revision = 'c144451e249a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+    op.create_index('ix_Venue_created_date_id', 'Venue', ['created_date', 'id'], unique=False)
+    # venues without a city or state are listed as if it were empty, see get_venues_grouped_by_location
+    op.create_index('ix_Venue_state_city_id', 'Venue', [sa.text("coalesce(state, '')"), sa.text("coalesce(city, '')"),
+                                                        'id'], unique=False)
+    op.create_index('ix_Artist_created_date_id', 'Artist', ['created_date', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Artist_created_date_id', table_name='Artist')
+    op.drop_index('ix_Venue_state_city_id', table_name='Venue')
+    op.drop_index('ix_Venue_created_date_id', table_name='Venue')
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
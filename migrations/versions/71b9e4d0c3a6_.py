@@ -0,0 +1,30 @@
+"""add updated_date to Venue and Artist
+
+Revision ID: 71b9e4d0c3a6
+Revises: a83f2c9d1e07
+Create Date: 2026-10-18 11:40:19.804512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '71b9e4d0c3a6'
+down_revision = 'a83f2c9d1e07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Artist', sa.Column('updated_date', sa.DateTime(), nullable=True))
+    op.add_column('Venue', sa.Column('updated_date', sa.DateTime(), nullable=True))
+    op.execute('UPDATE "Artist" SET updated_date = created_date')
+    op.execute('UPDATE "Venue" SET updated_date = created_date')
+    op.alter_column('Artist', 'updated_date', existing_type=sa.DateTime(), nullable=False)
+    op.alter_column('Venue', 'updated_date', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    op.drop_column('Venue', 'updated_date')
+    op.drop_column('Artist', 'updated_date')
@@ -0,0 +1,32 @@
+"""add trigram indexes for name search
+
+Revision ID: a83f2c9d1e07
+Revises: 5d0e6a2b7f41
+Create Date: 2026-10-18 11:02:54.190337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a83f2c9d1e07'
+down_revision = '5d0e6a2b7f41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # databases without pg_trgm use the in-process search index instead (SEARCH_BACKEND = 'ngram')
+    if not op.get_bind().execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).scalar():
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_Artist_name_trgm', 'Artist', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS "ix_Artist_name_trgm"')
+    op.execute('DROP INDEX IF EXISTS "ix_Venue_name_trgm"')
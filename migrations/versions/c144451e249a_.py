@@ -0,0 +1,36 @@
+"""make keyset pagination columns non nullable
+
+Revision ID: c144451e249a
+Revises: be701fa8f6e1
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c144451e249a'
+down_revision = 'be701fa8f6e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # rows listed before created_date existed have no value, give them the oldest possible date so that they stay
+    # at the start of the listings
+    op.execute('UPDATE "Artist" SET created_date = \'epoch\' WHERE created_date IS NULL')
+    op.execute('UPDATE "Venue" SET created_date = \'epoch\' WHERE created_date IS NULL')
+    op.execute('UPDATE "Show" SET created_date = \'epoch\' WHERE created_date IS NULL')
+    op.execute('UPDATE "Show" SET start_time = created_date WHERE start_time IS NULL')
+    op.alter_column('Artist', 'created_date', existing_type=sa.DateTime(), nullable=False)
+    op.alter_column('Venue', 'created_date', existing_type=sa.DateTime(), nullable=False)
+    op.alter_column('Show', 'created_date', existing_type=sa.DateTime(), nullable=False)
+    op.alter_column('Show', 'start_time', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    op.alter_column('Show', 'start_time', existing_type=sa.DateTime(), nullable=True)
+    op.alter_column('Show', 'created_date', existing_type=sa.DateTime(), nullable=True)
+    op.alter_column('Venue', 'created_date', existing_type=sa.DateTime(), nullable=True)
+    op.alter_column('Artist', 'created_date', existing_type=sa.DateTime(), nullable=True)
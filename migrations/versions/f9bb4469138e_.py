@@ -0,0 +1,55 @@
+"""add Location table referenced by Venue, with stored venue and upcoming show counts
+
+Revision ID: f9bb4469138e
+Revises: 5261a9782bf9
+Create Date: 2026-10-18 16:41:07.318524
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f9bb4469138e'
+down_revision = '5261a9782bf9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Location',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('city', sa.String(length=120), nullable=False),
+                    sa.Column('state', sa.String(length=120), nullable=False),
+                    sa.Column('venue_count', sa.Integer(), server_default='0', nullable=False),
+                    sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    # cities and states are matched trimmed and in lower case, see models.location_key
+    op.create_index('uq_Location_state_city', 'Location',
+                    [sa.text('lower(btrim(state))'), sa.text('lower(btrim(city))')], unique=True)
+    op.add_column('Venue', sa.Column('location_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('Venue_location_id_fkey', 'Venue', 'Location', ['location_id'], ['id'])
+    op.create_index('ix_Venue_location_id_id', 'Venue', ['location_id', 'id'], unique=False)
+    # the /venues listing is ordered by location instead of state and city
+    op.drop_index('ix_Venue_state_city_id', table_name='Venue')
+    op.create_index('ix_Venue_location_key_id', 'Venue', [sa.text('coalesce(location_id, 0)'), 'id'], unique=False)
+    # venues without a city or state get no location. A location is named after its first venue
+    op.execute('INSERT INTO "Location" (city, state) '
+               'SELECT DISTINCT ON (lower(btrim(state)), lower(btrim(city))) btrim(city), btrim(state) FROM "Venue" '
+               "WHERE btrim(city) <> '' AND btrim(state) <> '' ORDER BY lower(btrim(state)), lower(btrim(city)), id")
+    op.execute('UPDATE "Venue" v SET location_id = l.id FROM "Location" l '
+               'WHERE lower(btrim(l.city)) = lower(btrim(v.city)) AND lower(btrim(l.state)) = lower(btrim(v.state))')
+    op.execute('UPDATE "Location" l SET venue_count = c.venues, upcoming_shows_count = c.upcoming '
+               'FROM (SELECT location_id, count(*) AS venues, sum(upcoming_shows_count) AS upcoming FROM "Venue" '
+               'WHERE location_id IS NOT NULL GROUP BY location_id) c WHERE c.location_id = l.id')
+
+
+def downgrade():
+    op.drop_index('ix_Venue_location_key_id', table_name='Venue')
+    op.create_index('ix_Venue_state_city_id', 'Venue', [sa.text("coalesce(state, '')"), sa.text("coalesce(city, '')"),
+                                                        'id'], unique=False)
+    op.drop_index('ix_Venue_location_id_id', table_name='Venue')
+    op.drop_constraint('Venue_location_id_fkey', 'Venue', type_='foreignkey')
+    op.drop_column('Venue', 'location_id')
+    op.drop_table('Location')
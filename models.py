@@ -2,10 +2,21 @@
 
 import datetime
 
-from sqlalchemy import DateTime
+from sqlalchemy import DateTime, func, text
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
 
 from appconfig import db
 
+# Length of a show when none is given
+DEFAULT_SHOW_DURATION_MINUTES = 120
+
+
+def _show_overlap_constraint(name, id_column):
+    # the id is compared as a single value range, so the GiST index behind the constraint works with the built-in range
+    # operator classes and doesn't need the btree_gist extension
+    return ExcludeConstraint((text(f"int4range({id_column}, {id_column}, '[]')"), '&&'),
+                             (text('tsrange(start_time, end_time)'), '&&'), name=name, using='gist')
+
 
 class Base(db.Model):
     __abstract__ = True
@@ -19,7 +30,12 @@ class Base(db.Model):
     facebook_link = db.Column(db.String(120))
     seeking_description = db.Column(db.String)
     image_link = db.Column(db.String)
-    created_date = db.Column(DateTime, default=datetime.datetime.utcnow)
+    created_date = db.Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    updated_date = db.Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow,
+                             nullable=False)
+    # stored show counters, kept current by helpers.refresh_show_counts and the sweep-show-counters command
+    past_shows_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    upcoming_shows_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
 
     @property
     def short_serialize(self):
@@ -29,11 +45,53 @@ class Base(db.Model):
         }
 
 
+def location_key(value):
+    # cities and states are matched to their Location trimmed and in lower case, 'Seattle' and 'seattle ' are one city
+    return func.lower(func.btrim(value))
+
+
+# A city and state venues are in, along with stored aggregates of its venues kept current by
+# helpers.refresh_location_counts. City and state are stored as first entered, trimmed
+class Location(db.Model):
+    __tablename__ = 'Location'
+
+    id = db.Column(db.Integer, primary_key=True)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    venue_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    upcoming_shows_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
+    def __repr__(self):
+        return f'<Location Id: {self.id}, {self.city}, {self.state}>'
+
+    @property
+    def serialize(self):
+        return {
+            'id': self.id,
+            'city': self.city,
+            'state': self.state,
+            'venue_count': self.venue_count,
+            'upcoming_shows_count': self.upcoming_shows_count
+        }
+
+
+db.Index('uq_Location_state_city', location_key(Location.state), location_key(Location.city), unique=True)
+
+
 class Venue(Base):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_created_date_id', 'created_date', 'id'),
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_location_id_id', 'location_id', 'id'),
+        # the /venues listing, venues without a location first
+        db.Index('ix_Venue_location_key_id', text('coalesce(location_id, 0)'), 'id'),
+    )
 
     address = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
+    # the Location of city and state, None while either is empty
+    location_id = db.Column(db.Integer, db.ForeignKey('Location.id'))
 
     def __repr__(self):
         return f'<Venue Id: {self.id}, Venue Name: {self.name}>'
@@ -41,8 +99,14 @@ class Venue(Base):
     @property
     def venue_details(self):
         import helpers
-        past_shows = helpers.get_past_shows_at_venue(self.id)
-        upcoming_shows = helpers.get_upcoming_shows_at_venue(self.id)
+        past_shows, upcoming_shows = helpers.partition_shows(helpers.get_shows_at_venue(self.id),
+                                                             datetime.datetime.now())
+        return self.venue_details_with_shows(past_shows, upcoming_shows)
+
+    def venue_details_with_shows(self, past_shows, upcoming_shows):
+        """
+        Venue page data from shows loaded by the caller, with their artists loaded
+        """
         return {
             'id': self.id,
             'name': self.name,
@@ -72,6 +136,10 @@ class Venue(Base):
 
 class Artist(Base):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_created_date_id', 'created_date', 'id'),
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     seeking_venue = db.Column(db.Boolean)
 
@@ -81,8 +149,14 @@ class Artist(Base):
     @property
     def artist_details(self):
         import helpers
-        past_shows = helpers.get_past_shows_of_artist(self.id)
-        upcoming_shows = helpers.get_upcoming_shows_of_artist(self.id)
+        past_shows, upcoming_shows = helpers.partition_shows(helpers.get_shows_of_artist(self.id),
+                                                             datetime.datetime.now())
+        return self.artist_details_with_shows(past_shows, upcoming_shows)
+
+    def artist_details_with_shows(self, past_shows, upcoming_shows):
+        """
+        Artist page data from shows loaded by the caller, with their venues loaded
+        """
         return {
             'id': self.id,
             'name': self.name,
@@ -104,14 +178,27 @@ class Artist(Base):
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        # a venue or an artist can't have two shows overlapping in time
+        _show_overlap_constraint('ex_Show_venue_id_period', 'venue_id'),
+        _show_overlap_constraint('ex_Show_artist_id_period', 'artist_id'),
+        db.CheckConstraint('duration_minutes >= 1', name='ck_Show_duration_minutes'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    start_time = db.Column(db.DateTime())
+    start_time = db.Column(db.DateTime(), nullable=False)
+    duration_minutes = db.Column(db.Integer, default=DEFAULT_SHOW_DURATION_MINUTES,
+                                 server_default=str(DEFAULT_SHOW_DURATION_MINUTES), nullable=False)
+    end_time = db.Column(db.DateTime(), db.Computed("start_time + duration_minutes * interval '1 minute'"),
+                         nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     artist = db.relationship('Artist', backref=db.backref('Show', cascade="all,delete"))
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
     venue = db.relationship('Venue', backref=db.backref('Show', cascade="all,delete"))
-    created_date = db.Column(DateTime, default=datetime.datetime.utcnow)
+    created_date = db.Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
 
     def __repr__(self):
         return f'<Show Id: {self.id}, Artist: {self.artist}>, Venue Id: {self.venue}'
@@ -119,28 +206,44 @@ class Show(db.Model):
     @property
     def artist_serializer(self):
         return {
+            'show_id': self.id,
+            'last_modified': self.artist.updated_date,
             'artist_id': self.artist_id,
             'artist_name': self.artist.name,
             'artist_image_link': self.artist.image_link,
-            'start_time': str(self.start_time)
+            'start_time': self.start_time
         }
 
     @property
     def venue_serializer(self):
         return {
+            'show_id': self.id,
+            'last_modified': self.venue.updated_date,
             'venue_id': self.venue_id,
             'venue_name': self.venue.name,
             'venue_image_link': self.venue.image_link,
-            'start_time': str(self.start_time)
+            'start_time': self.start_time
         }
 
     @property
     def show_details(self):
         return {
+            'show_id': self.id,
+            'last_modified': max(self.artist.updated_date, self.venue.updated_date),
             'venue_id': self.venue_id,
             'venue_name': self.venue.name,
             'artist_id': self.artist_id,
             'artist_name': self.artist.name,
             'artist_image_link': self.artist.image_link,
-            'start_time': str(self.start_time)
+            'start_time': self.start_time,
+            'end_time': self.end_time
         }
+
+
+# Single row holding the time of the last show counter sweep, the sweep moves shows that started since from the upcoming
+# to the past counters
+class ShowCounterSweep(db.Model):
+    __tablename__ = 'ShowCounterSweep'
+
+    id = db.Column(db.Integer, primary_key=True)
+    swept_at = db.Column(db.DateTime(), nullable=False)
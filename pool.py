@@ -0,0 +1,58 @@
+# Database connection pool
+#
+# The engine of every worker process uses TimedQueuePool, which counts how long requests wait for a connection so
+# that /internal/pool shows whether the pool of a worker is sized for its load.
+
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool which records the time spent getting a connection, i.e. waiting for a free one, opening a new one and
+    the pre-ping, and counts checkouts that timed out
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def connect(self):
+        started_at = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started_at
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    @property
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                'size': self.size(),
+                'checked_in': self.checkedin(),
+                'checked_out': self.checkedout(),
+                # QueuePool counts overflow from -size, it is negative until all pool_size connections are open
+                'overflow': max(self.overflow(), 0),
+                'max_overflow': self._max_overflow,
+                'timeout': self._timeout,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': self.wait_seconds,
+                'wait_seconds_avg': self.wait_seconds / self.checkouts if self.checkouts else None,
+                'wait_seconds_max': self.max_wait_seconds,
+            }
@@ -0,0 +1,123 @@
+# Read replica routing
+#
+# Handlers decorated with read_only read from a replica (the SQLALCHEMY_BINDS named replica_*), everything else uses
+# the primary. A request sticks to one replica, and anything that writes goes to the primary along with all reads of
+# the request after it. After a write the client keeps reading from the primary for REPLICA_MAX_LAG_SECONDS, so a
+# redirect to a read only page shows what was just written. The deadline is kept in the session cookie, so with more
+# than one worker process SECRET_KEY has to be set in the environment for all of them. Replicas lagging behind more
+# than REPLICA_MAX_LAG_SECONDS or not reachable are skipped, with no usable replica left reads fall back to the primary.
+
+import functools
+import random
+import threading
+import time
+
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import exc, text
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+# Seconds the replica is behind the primary, 0 when it has replayed everything it received. NULL on a primary
+LAG_QUERY = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+def read_only(view):
+    """
+    Marks a handler as only reading from the database, so its queries may go to a replica
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaLagMonitor:
+    """
+    Keeps the lag of every replica, measured at most once every REPLICA_LAG_CHECK_SECONDS per replica. A replica whose
+    lag is being measured for the first time or couldn't be measured counts as unusable
+    """
+
+    def __init__(self):
+        self._lag = {}
+        self._checked_at = {}
+        self._lock = threading.Lock()
+
+    def lag(self, key, engine):
+        """
+        Returns the lag of the replica, measuring it if the last measurement is due
+        :param key: Bind key of the replica
+        :param engine: Engine of the replica
+        :return: Lag in seconds, None if it couldn't be measured
+        """
+        now = time.monotonic()
+        with self._lock:
+            checked_at = self._checked_at.get(key)
+            if checked_at is not None and now - checked_at < current_app.config['REPLICA_LAG_CHECK_SECONDS']:
+                return self._lag.get(key)
+            # other requests keep using the previous measurement meanwhile
+            self._checked_at[key] = now
+        try:
+            with engine.connect() as connection:
+                lag = float(connection.execute(LAG_QUERY).scalar() or 0)
+        except exc.SQLAlchemyError as ex:
+            current_app.logger.warning('Replica %s is not reachable: %s', key, ex)
+            lag = None
+        with self._lock:
+            self._lag[key] = lag
+        return lag
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._lag)
+
+
+lag_monitor = ReplicaLagMonitor()
+
+
+class RoutingSession(Session):
+    """
+    Session sending the reads of read only handlers to a replica
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or getattr(clause, 'is_dml', False):
+                _record_write()
+            elif g.get('read_only') and not _reads_from_primary():
+                engine = self._replica()
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica(self):
+        """
+        Returns the engine of the replica this request reads from, picking one at random on first use
+        :return: Engine, None if no replica is usable
+        """
+        if 'replica_key' not in g:
+            max_lag = current_app.config['REPLICA_MAX_LAG_SECONDS']
+            usable = []
+            for key, engine in self._db.engines.items():
+                if key and key.startswith(REPLICA_BIND_PREFIX):
+                    lag = lag_monitor.lag(key, engine)
+                    if lag is not None and lag <= max_lag:
+                        usable.append(key)
+            g.replica_key = random.choice(usable) if usable else None
+        return self._db.engines[g.replica_key] if g.replica_key else None
+
+
+def _record_write():
+    g.wrote = True
+    session['read_primary_until'] = time.time() + current_app.config['REPLICA_MAX_LAG_SECONDS']
+
+
+def _reads_from_primary() -> bool:
+    return g.get('wrote', False) or session.get('read_primary_until', 0) > time.time()
@@ -0,0 +1,138 @@
+# In-process n-gram search index
+#
+# Used for name search when SEARCH_BACKEND is 'ngram', i.e. on databases where pg_trgm can't be installed. Every
+# process keeps its own index, built from the database on first use, kept up to date by the create, edit and delete
+# handlers and rebuilt every SEARCH_INDEX_MAX_AGE seconds to pick up writes made by other processes.
+
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+
+from flask import current_app
+
+from appconfig import db
+from models import Venue, Artist
+
+
+class NgramIndex:
+    """
+    Inverted index from the character n-grams of a name to the sorted ids of the entities having that n-gram. Posting
+    lists are int arrays so the index stays compact, roughly 4 bytes per (n-gram, id) pair plus the lowercased names
+    """
+
+    def __init__(self, model, n=3):
+        self.model = model
+        self.n = n
+        self.built_at = None
+        self._postings = {}
+        self._names = {}
+        self._lock = threading.RLock()
+
+    def _grams(self, text) -> set:
+        return {text[i:i + self.n] for i in range(len(text) - self.n + 1)}
+
+    def _add(self, entity_id, name):
+        name = (name or '').lower()
+        self._names[entity_id] = name
+        for gram in self._grams(name):
+            insort(self._postings.setdefault(gram, array('i')), entity_id)
+
+    def _remove(self, entity_id):
+        name = self._names.pop(entity_id, None)
+        if name is None:
+            return
+        for gram in self._grams(name):
+            posting = self._postings[gram]
+            del posting[bisect_left(posting, entity_id)]
+            if not posting:
+                del self._postings[gram]
+
+    def rebuild(self):
+        """
+        Rebuilds the index from the database
+        """
+        rows = db.session.query(self.model.id, self.model.name).order_by(self.model.id).yield_per(10000)
+        names, postings = {}, {}
+        for entity_id, name in rows:
+            name = (name or '').lower()
+            names[entity_id] = name
+            for gram in self._grams(name):
+                # rows come ordered by id, so appending keeps the posting lists sorted
+                postings.setdefault(gram, array('i')).append(entity_id)
+        with self._lock:
+            self._names, self._postings = names, postings
+            self.built_at = time.monotonic()
+
+    def ensure_fresh(self):
+        """
+        Builds the index if it hasn't been built yet or is older than SEARCH_INDEX_MAX_AGE seconds
+        """
+        max_age = current_app.config['SEARCH_INDEX_MAX_AGE']
+        if self.built_at is None or (max_age is not None and time.monotonic() - self.built_at > max_age):
+            self.rebuild()
+
+    def add(self, entity_id, name):
+        """
+        Adds an entity to the index or replaces its name. Does nothing until the index is built, the build reads the
+        entity from the database anyway
+        :param entity_id: Id of the entity
+        :param name: Name of the entity
+        """
+        with self._lock:
+            if self.built_at is not None:
+                self._remove(entity_id)
+                self._add(entity_id, name)
+
+    def remove(self, entity_id):
+        """
+        Removes an entity from the index
+        :param entity_id: Id of the entity
+        """
+        with self._lock:
+            self._remove(entity_id)
+
+    def search(self, search_term, limit) -> list:
+        """
+        Returns the ids of the entities whose name contains the search term (case insensitive). The candidates are the
+        intersection of the posting lists of the term's n-grams, which is then checked against the names to drop
+        false positives. Shorter names rank first as they are the closer matches
+        :param search_term: Search term
+        :param limit: Maximum number of ids to return
+        :return: List of ids
+        """
+        self.ensure_fresh()
+        term = search_term.lower()
+        with self._lock:
+            grams = self._grams(term)
+            if not grams:
+                # term is shorter than an n-gram, no posting list to narrow down with
+                candidates = self._names.keys()
+            elif any(gram not in self._postings for gram in grams):
+                candidates = []
+            else:
+                posting_lists = sorted((self._postings[gram] for gram in grams), key=len)
+                candidates = [entity_id for entity_id in posting_lists[0]
+                              if all(_contains(posting, entity_id) for posting in posting_lists[1:])]
+            matches = [entity_id for entity_id in candidates if term in self._names[entity_id]]
+            matches.sort(key=lambda entity_id: (len(self._names[entity_id]), entity_id))
+        return matches[:limit]
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entities': len(self._names),
+                'ngrams': len(self._postings),
+                'postings': sum(len(posting) for posting in self._postings.values()),
+                'posting_bytes': sum(posting.itemsize * len(posting) for posting in self._postings.values()),
+            }
+
+
+def _contains(posting, entity_id) -> bool:
+    i = bisect_left(posting, entity_id)
+    return i < len(posting) and posting[i] == entity_id
+
+
+venue_index = NgramIndex(Venue)
+artist_index = NgramIndex(Artist)
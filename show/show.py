@@ -1,23 +1,61 @@
-from flask import Blueprint, render_template, flash, request, redirect, url_for
+import csv
+from datetime import date, datetime, timedelta
+from itertools import groupby
+
+import dateutil.parser
+from flask import Blueprint, abort, current_app, render_template, flash, request, redirect, url_for
 
 from appconfig import db
-from forms import ShowForm
-from helpers import search_show
-from models import Show, Artist, Venue
+from cache import invalidate_pages
+from forms import ShowForm, BatchShowForm
+from helpers import get_shows_page, search_show, get_existing_artist_and_venue_ids, insert_shows, refresh_show_counts, \
+    get_shows_between, get_overlapping_shows, get_overlaps_within, get_location_by_id
+from models import Show, DEFAULT_SHOW_DURATION_MINUTES
+from routing import read_only
 
 show = Blueprint('show', __name__, template_folder='templates')
 
 
 @show.route('/shows')
+@read_only
 def shows():
     """
-    Handler to show all shows
-    :return: Rendered template to display all shows
+    Handler to show all shows, a page at a time
+    :return: Rendered template to display a page of shows
     """
-    all_shows = Show.query.all()
+    page = get_shows_page(request.args.get('cursor'), request.args.get('direction', 'next'))
     # prepare data for template
-    data = [s.show_details for s in all_shows]
-    return render_template('pages/shows.html', shows=data)
+    data = [s.show_details for s in page.items]
+    return render_template('pages/shows.html', shows=data, page=page)
+
+
+@show.route('/shows/calendar')
+@read_only
+def shows_calendar():
+    """
+    Handler to show the shows of a number of days, grouped by day. The first day (start, default today), the number of
+    days (days) and the location_id or venue_id to narrow the shows to are taken from the query string
+    :return: Rendered template to display the shows of the days
+    """
+    try:
+        start = date.fromisoformat(request.args['start']) if 'start' in request.args else date.today()
+        days = int(request.args.get('days', current_app.config['SHOW_CALENDAR_DAYS']))
+    except ValueError:
+        abort(400)
+    days = min(max(days, 1), current_app.config['SHOW_CALENDAR_MAX_DAYS'])
+    venue_id = request.args.get('venue_id', type=int)
+    location_id = request.args.get('location_id', type=int)
+    area = get_location_by_id(location_id).serialize if location_id is not None else None
+    window_start = datetime.combine(start, datetime.min.time())
+    shows = get_shows_between(window_start, window_start + timedelta(days=days), location_id, venue_id).all()
+    # prepare data for template
+    calendar = [{'day': day, 'shows': [s.show_details for s in day_shows]}
+                for day, day_shows in groupby(shows, key=lambda s: s.start_time.date())]
+    filters = {k: v for k, v in [('location_id', location_id), ('venue_id', venue_id)] if v is not None}
+    return render_template('pages/shows_calendar.html', calendar=calendar, start=start, days=days, area=area,
+                           filters=filters,
+                           previous_start=(start - timedelta(days=days)).isoformat(),
+                           next_start=(start + timedelta(days=days)).isoformat())
 
 
 @show.route('/show/create')
@@ -30,28 +68,65 @@ def create_shows():
     return render_template('forms/new_show.html', form=form)
 
 
+def overlap_message(overlap) -> str:
+    """
+    Returns the message rejecting a show which overlaps an existing show
+    :param overlap: Tuple of ('venue' or 'artist', id (pk) of the existing show, its start time)
+    """
+    kind, show_id, start_time = overlap
+    return 'The ' + kind + ' already has show ' + str(show_id) + ' at that time, starting ' + \
+        start_time.strftime('%Y-%m-%d %H:%M')
+
+
+def duration_error(duration_minutes):
+    """
+    Returns the message rejecting a show duration, None if the duration is valid
+    :param duration_minutes: Duration in minutes, None if it isn't a number
+    """
+    if duration_minutes is None or not 1 <= duration_minutes <= 24 * 60:
+        return 'Duration must be between 1 and 1440 minutes'
+    return None
+
+
 @show.route('/show/create', methods=['POST'])
 def create_show_submission():
     """
     Create show submission Post handler. Creates a new show and message is flashed on successful creation or in case of
-    failure
+    failure. A show overlapping another show at the venue or of the artist is rejected
     :return: Rendered home page template
     """
     form = ShowForm()
     artist_id = form.artist_id.data
     venue_id = form.venue_id.data
+    # the form isn't validated as a whole, an empty duration means the default one
+    if ''.join(form.duration_minutes.raw_data or []).strip():
+        duration_minutes = form.duration_minutes.data
+    else:
+        duration_minutes = DEFAULT_SHOW_DURATION_MINUTES
+    message = duration_error(duration_minutes)
+    if message:
+        flash(message + '. Show could not be listed.', 'danger')
+        return redirect(url_for('index'))
     error = False
     try:
-        if Artist.query.get(artist_id) and Venue.query.get(venue_id):
-            new_show = Show(
-                artist_id=form.artist_id.data,
-                venue_id=form.venue_id.data,
-                start_time=form.start_time.data,
-            )
-            db.session.add(new_show)
-            db.session.commit()
-
-            flash('Show was successfully listed!', 'info')
+        artist_ids, venue_ids = get_existing_artist_and_venue_ids([artist_id], [venue_id])
+        if artist_ids and venue_ids:
+            new_show = {
+                'artist_id': int(artist_id),
+                'venue_id': int(venue_id),
+                'start_time': form.start_time.data,
+                'duration_minutes': duration_minutes,
+            }
+            overlap = get_overlapping_shows([new_show])[0]
+            if overlap:
+                flash(overlap_message(overlap), 'danger')
+            else:
+                db.session.add(Show(**new_show))
+                refresh_show_counts([venue_id], [artist_id])
+                db.session.commit()
+                invalidate_pages([venue_id], [artist_id])
+
+                flash('Show was successfully listed!', 'info')
         else:
             error = True
     except Exception as ex:
@@ -68,7 +143,110 @@ def create_show_submission():
     return redirect(url_for('index'))
 
 
+def parse_batch(text) -> list:
+    """
+    Parses the lines of a batch of shows. Blank lines are skipped
+    :param text: One show per line as "artist_id, venue_id, start_time" or "artist_id, venue_id, start_time,
+    duration_minutes"
+    :return: List of row dicts with line, artist_id, venue_id, start_time, duration_minutes and error, which is None
+    for rows that parsed
+    """
+    rows = []
+    for line_number, fields in enumerate(csv.reader(text.splitlines(), skipinitialspace=True), start=1):
+        if not any(f.strip() for f in fields):
+            continue
+        row = {'line': line_number, 'artist_id': None, 'venue_id': None, 'start_time': None,
+               'duration_minutes': DEFAULT_SHOW_DURATION_MINUTES, 'error': None}
+        rows.append(row)
+        if len(fields) not in (3, 4):
+            row['error'] = 'Expected "artist_id, venue_id, start_time" and optionally ", duration_minutes"'
+            continue
+        try:
+            row['artist_id'], row['venue_id'] = int(fields[0]), int(fields[1])
+        except ValueError:
+            row['error'] = 'Artist ID and Venue ID must be numbers'
+            continue
+        try:
+            row['start_time'] = dateutil.parser.parse(fields[2])
+        except (ValueError, OverflowError):
+            row['error'] = 'Invalid start time "' + fields[2] + '"'
+            continue
+        if len(fields) == 4:
+            try:
+                row['duration_minutes'] = int(fields[3])
+            except ValueError:
+                row['duration_minutes'] = None
+            row['error'] = duration_error(row['duration_minutes'])
+    return rows
+
+
+@show.route('/show/create/batch')
+def create_shows_batch():
+    """
+    Handler to open the create shows in batch form
+    :return: Rendered Create shows in batch form
+    """
+    form = BatchShowForm()
+    return render_template('forms/new_show_batch.html', form=form, results=None)
+
+
+@show.route('/show/create/batch', methods=['POST'])
+def create_shows_batch_submission():
+    """
+    Create shows in batch submission Post handler. The artist and venue ids of all rows are checked in one query, as
+    are the overlaps with existing shows, and the valid rows are inserted in one statement and committed together. Rows
+    referring to a missing artist or venue or overlapping another show at the venue or of the artist are rejected
+    :return: Rendered form with the outcome of every row
+    """
+    form = BatchShowForm()
+    results = parse_batch(form.shows.data or '')
+    parsed = [r for r in results if r['error'] is None]
+    try:
+        if parsed:
+            artist_ids, venue_ids = get_existing_artist_and_venue_ids({r['artist_id'] for r in parsed},
+                                                                      {r['venue_id'] for r in parsed})
+            for row in parsed:
+                if row['artist_id'] not in artist_ids:
+                    row['error'] = 'Artist with artist_id "' + str(row['artist_id']) + '" doesn\'t exist'
+                elif row['venue_id'] not in venue_ids:
+                    row['error'] = 'Venue with venue_id "' + str(row['venue_id']) + '" doesn\'t exist'
+            valid = [r for r in parsed if r['error'] is None]
+            # rows overlapping existing shows are rejected first, so that they don't count against the other rows
+            for row, overlap in zip(valid, get_overlapping_shows(valid)):
+                if overlap:
+                    row['error'] = overlap_message(overlap)
+            valid = [r for r in valid if r['error'] is None]
+            for row, overlap in zip(valid, get_overlaps_within(valid)):
+                if overlap:
+                    kind, other = overlap
+                    row['error'] = 'The ' + kind + ' already has the show of line ' + str(valid[other]['line']) + \
+                                   ' at that time'
+            valid = [r for r in valid if r['error'] is None]
+            if valid:
+                show_ids = insert_shows([{'artist_id': r['artist_id'], 'venue_id': r['venue_id'],
+                                          'start_time': r['start_time'], 'duration_minutes': r['duration_minutes']}
+                                         for r in valid])
+                refresh_show_counts({r['venue_id'] for r in valid}, {r['artist_id'] for r in valid})
+                db.session.commit()
+                for row, show_id in zip(valid, show_ids):
+                    row['show_id'] = show_id
+                invalidate_pages({r['venue_id'] for r in valid}, {r['artist_id'] for r in valid})
+        created = sum(1 for r in results if r.get('show_id'))
+        flash(str(created) + ' of ' + str(len(results)) + ' shows were successfully listed!',
+              'info' if created == len(results) else 'danger')
+    except Exception as ex:
+        db.session.rollback()
+        for row in results:
+            row.pop('show_id', None)
+        flash('Error occurred. Shows could not be listed.' + str(ex), 'danger')
+    finally:
+        db.session.close()
+
+    return render_template('forms/new_show_batch.html', form=form, results=results)
+
+
 @show.route('/shows/search', methods=['POST'])
+@read_only
 def search_shows():
     """
     Search show Post handler. Searches shows by partial text match on artist name or virtual name
@@ -80,7 +258,5 @@ def search_shows():
         'count': len(shows_searched),
         'data': [s.show_details for s in shows_searched]
     }
-
-    print(response)
     return render_template('pages/show.html', results=response,
                            search_term=request.form.get('search_term', ''))
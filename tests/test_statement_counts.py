@@ -0,0 +1,156 @@
+# Statement count regression tests
+#
+# Requests pages with the per request SQL instrumentation (see instrumentation.py) and checks that they run a fixed
+# number of statements however many rows they show. The tests run against the database DATABASE_URL points to, like
+# the app, and remove the rows they create. They are skipped when the database can't be reached.
+#
+#   DATABASE_URL=postgresql://postgres@localhost:5432/fyyur python -m pytest tests
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import app
+from appconfig import db
+from cache import page_cache, fragment_cache
+from helpers import get_location_id, refresh_location_counts, refresh_show_counts
+from models import Venue, Artist, Show, Location
+
+# state of the test venues, their locations are deleted by it afterwards
+TEST_STATE = '00'
+
+
+@pytest.fixture(scope='module')
+def client():
+    with app.app_context():
+        try:
+            db.session.execute(text('SELECT 1'))
+        except OperationalError:
+            pytest.skip('database not reachable')
+        finally:
+            db.session.close()
+    headers = app.config['SQL_STATS_HEADERS']
+    max_entries = page_cache.max_entries, fragment_cache.max_entries
+    app.config['SQL_STATS_HEADERS'] = True
+    # cached pages and fragments would hide the statements
+    page_cache.max_entries = fragment_cache.max_entries = 0
+    yield app.test_client()
+    app.config['SQL_STATS_HEADERS'] = headers
+    page_cache.max_entries, fragment_cache.max_entries = max_entries
+
+
+class Catalog:
+    """
+    Venues, artists and shows created by a test, deleted again afterwards
+    """
+
+    def __init__(self):
+        self.venue_ids = []
+        self.artist_ids = []
+
+    def venue(self, city) -> int:
+        with app.app_context():
+            venue = Venue(name='Statement count venue', city=city, state=TEST_STATE, genres=['Jazz'],
+                          location_id=get_location_id(city, TEST_STATE))
+            db.session.add(venue)
+            db.session.flush()
+            refresh_location_counts([venue.location_id])
+            db.session.commit()
+            self.venue_ids.append(venue.id)
+            return venue.id
+
+    def artist(self) -> int:
+        with app.app_context():
+            artist = Artist(name='Statement count artist', city='Area 0', state=TEST_STATE, genres=['Jazz'])
+            db.session.add(artist)
+            db.session.commit()
+            self.artist_ids.append(artist.id)
+            return artist.id
+
+    def show(self, venue_id, artist_id, start_time):
+        with app.app_context():
+            db.session.add(Show(venue_id=venue_id, artist_id=artist_id, start_time=start_time))
+            db.session.flush()
+            refresh_show_counts([venue_id], [artist_id])
+            db.session.commit()
+
+    def delete(self):
+        with app.app_context():
+            Show.query.filter(db.or_(Show.venue_id.in_(self.venue_ids), Show.artist_id.in_(self.artist_ids))).delete()
+            Artist.query.filter(Artist.id.in_(self.artist_ids)).delete()
+            Venue.query.filter(Venue.id.in_(self.venue_ids)).delete()
+            Location.query.filter(Location.state == TEST_STATE).delete()
+            db.session.commit()
+
+
+@pytest.fixture
+def catalog(client):
+    catalog = Catalog()
+    yield catalog
+    catalog.delete()
+
+
+def statements(client, url, data=None) -> int:
+    """
+    Requests a page, with a POST if there is form data, and returns the number of SQL statements it ran
+    """
+    response = client.post(url, data=data) if data else client.get(url)
+    assert response.status_code == 200
+    return int(response.headers['X-SQL-Count'])
+
+
+def test_venues_listing_runs_one_statement_for_any_number_of_areas(client, catalog):
+    catalog.venue('Area 0')
+    assert statements(client, '/venues') == 1
+    for i in range(1, 11):
+        catalog.venue(f'Area {i}')
+    assert statements(client, '/venues') == 1
+
+
+def daily(start):
+    """
+    Yields show start times a day apart, so that shows of the same venue or artist don't overlap
+    """
+    while True:
+        yield start
+        start += timedelta(days=1)
+
+
+def test_venue_page_runs_the_same_statements_for_any_number_of_shows(client, catalog):
+    # each show with its own artist, a lazy load per show would show up as a statement per artist
+    venue_id = catalog.venue('Area 0')
+    start_times = daily(datetime.now().replace(microsecond=0) - timedelta(days=10))
+    for _ in range(2):
+        catalog.show(venue_id, catalog.artist(), next(start_times))
+    few_shows = statements(client, f'/venues/{venue_id}')
+    for _ in range(18):
+        catalog.show(venue_id, catalog.artist(), next(start_times))
+    assert statements(client, f'/venues/{venue_id}') == few_shows
+    assert few_shows <= 2
+
+
+def test_artist_page_runs_the_same_statements_for_any_number_of_shows(client, catalog):
+    artist_id = catalog.artist()
+    start_times = daily(datetime.now().replace(microsecond=0) - timedelta(days=10))
+    for i in range(2):
+        catalog.show(catalog.venue(f'Area {i}'), artist_id, next(start_times))
+    few_shows = statements(client, f'/artists/{artist_id}')
+    for i in range(2, 20):
+        catalog.show(catalog.venue(f'Area {i}'), artist_id, next(start_times))
+    assert statements(client, f'/artists/{artist_id}') == few_shows
+    assert few_shows <= 2
+
+
+@pytest.mark.parametrize('url, data', [('/shows', None), ('/shows/search', {'search_term': 'Statement count'})])
+def test_show_listings_run_the_same_statements_for_any_number_of_shows(client, catalog, url, data):
+    # shows before all others, so that they are on the first page
+    start_times = daily(datetime(1900, 1, 1, 20))
+    for i in range(2):
+        catalog.show(catalog.venue(f'Area {i}'), catalog.artist(), next(start_times))
+    few_shows = statements(client, url, data)
+    for i in range(2, 20):
+        catalog.show(catalog.venue(f'Area {i}'), catalog.artist(), next(start_times))
+    assert statements(client, url, data) == few_shows
+    assert few_shows <= 2
@@ -1,32 +1,47 @@
 from flask import Blueprint, render_template, flash, request, redirect, url_for
 
 from appconfig import db
+from cache import page_cache, invalidate_pages
+from feed import recent_venues
 from forms import VenueForm
-from helpers import get_venues_by_distinct_locations, get_venues_by_location, get_venue_by_id, search_venue
+from helpers import get_venues_grouped_by_location, get_venue_by_id, search_venue, get_artist_ids_with_shows_at_venue, \
+    refresh_show_counts, get_location_id, refresh_location_counts, get_location_by_id, get_venues_page_at_location
 from models import Venue
+from routing import read_only
+from search_index import venue_index
 
 venue = Blueprint('venue', __name__, template_folder='templates')
 
 
 @venue.route('/venues')
+@read_only
 def venues():
     """
     Handler to display the list of all venues grouped by City and State
     :return: Rendered template to show all venues
     """
-    # find all venues on the basis of distinct city and states
-    venues_by_locations = get_venues_by_distinct_locations()
-    data = []
-    if venues_by_locations:
-        # prepare data to be displayed in the template
-        data = [v.venue_location_serializer for v in venues_by_locations]
-        for venue_data in data:
-            venue_data['venues'] = get_venues_by_location(venue_data['city'], venue_data['state'])
-            venue_data['venue_count'] = len(venue_data['venues'])
-    return render_template('pages/venues.html', areas=data)
+    # a page of venues grouped by their location, fetched in a single query
+    page = get_venues_grouped_by_location(request.args.get('cursor'), request.args.get('direction', 'next'))
+    return render_template('pages/venues.html', areas=page.items, page=page)
+
+
+@venue.route('/venues/areas/<int:location_id>')
+@read_only
+def show_area(location_id):
+    """
+    Handler to show the venues of an area (a city and state), a page at a time
+    :param location_id: Id of the Location
+    :return: Rendered template to display the area and a page of its venues
+    """
+    location = get_location_by_id(location_id)
+    page = get_venues_page_at_location(location_id, request.args.get('cursor'), request.args.get('direction', 'next'))
+    # prepare data for template
+    data = [{**v.short_serialize, 'num_upcoming_shows': v.upcoming_shows_count} for v in page.items]
+    return render_template('pages/area.html', area=location.serialize, venues=data, page=page)
 
 
 @venue.route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
     """
     Search Venue Post handler. Search venues by venue name partial text match
@@ -38,20 +53,21 @@ def search_venues():
     # prepare data to shown in the template
     response = {
         'count': len(venues_by_text),
-        'data': [v.short_serializer for v in venues_by_text]
+        'data': [v.short_serialize for v in venues_by_text]
     }
     return render_template('pages/search_venues.html', results=response,
                            search_term=request.form.get('search_term', ''))
 
 
 @venue.route('/venues/<int:venue_id>')
+@read_only
 def show_venue(venue_id):
     """
     Handler to show a specific Venue
     :param venue_id: Id of the Venue
     :return: Rendered Show venue template
     """
-    data = get_venue_by_id(venue_id).venue_details
+    data = page_cache.get_or_set(('venue', venue_id), lambda: get_venue_by_id(venue_id).venue_details)
     return render_template('pages/show_venue.html', venue=data)
 
 
@@ -77,10 +93,12 @@ def create_venue_submission():
     form = VenueForm(request.form)
 
     try:
+        location_id = get_location_id(form.city.data, form.state.data)
         new_venue = Venue(
             name=form.name.data,
             city=form.city.data,
             state=form.state.data,
+            location_id=location_id,
             address=form.address.data,
             phone=form.phone.data,
             genres=form.genres.data,
@@ -92,7 +110,10 @@ def create_venue_submission():
         )
 
         db.session.add(new_venue)
+        refresh_location_counts([location_id])
         db.session.commit()
+        venue_index.add(new_venue.id, new_venue.name)
+        recent_venues.push(new_venue)
 
         flash('Venue ' + request.form['name'] + ' was successfully listed!', 'info')
 
@@ -115,9 +136,16 @@ def delete_venue(venue_id):
     try:
         venue_to_be_deleted = Venue.query.get(venue_id)
         venue_name = venue_to_be_deleted.name
+        artist_ids = get_artist_ids_with_shows_at_venue(venue_id)
         # delete the venue
         db.session.delete(venue_to_be_deleted)
+        # the shows at the venue are deleted with it
+        refresh_show_counts(artist_ids=artist_ids)
+        refresh_location_counts([venue_to_be_deleted.location_id])
         db.session.commit()
+        venue_index.remove(int(venue_id))
+        recent_venues.remove(int(venue_id))
+        invalidate_pages([venue_id], artist_ids)
         flash('Venue ' + venue_name + ' was successfully deleted!', 'info')
     except:
         db.session.rollback()
@@ -158,8 +186,10 @@ def edit_venue_submission(venue_id):
 
         venue_to_be_edited.name = name
         venue_to_be_edited.genres = form.genres.data
+        previous_location_id = venue_to_be_edited.location_id
         venue_to_be_edited.city = form.city.data
         venue_to_be_edited.state = form.state.data
+        venue_to_be_edited.location_id = get_location_id(form.city.data, form.state.data)
         venue_to_be_edited.address = form.address.data
         venue_to_be_edited.phone = form.phone.data
         venue_to_be_edited.facebook_link = form.facebook_link.data
@@ -167,8 +197,14 @@ def edit_venue_submission(venue_id):
         venue_to_be_edited.image_link = form.image_link.data
         venue_to_be_edited.seeking_talent = form.seeking_talent.data
         venue_to_be_edited.seeking_description = form.seeking_description.data
+        if venue_to_be_edited.location_id != previous_location_id:
+            refresh_location_counts([previous_location_id, venue_to_be_edited.location_id])
 
         db.session.commit()
+        venue_index.add(venue_id, name)
+        recent_venues.rename(venue_id, name)
+        # artist pages show the names of their venues
+        invalidate_pages([venue_id], get_artist_ids_with_shows_at_venue(venue_id))
         flash('Venue ' + name + ' was successfully updated!', 'info')
     except Exception:
         # In case of exception flash an error and rollback the transaction